@@ -0,0 +1,481 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tracemalloc
+import numpy as np
+import part2
+import part3
+import part4
+import part5
+from sharedFunctions import countCorpus, estEmissions, estTransitions, estTransitions2, getDictionary,\
+    buildTables, buildTables2, setPrecision, PRECISIONS, LOG_TABLES
+from tagger import tagLines
+from evalResult import evaluateFiles
+
+DATASETS = ["EN", "FR", "CN", "SG"]
+
+# epochs used when timing perceptron training
+EPOCHS = 5
+
+# a benchmark this much slower than the baseline is reported as a regression
+TOLERANCE = 0.10
+
+
+def readCorpus(file):
+    """
+    Reads a file of one word, or word and tag, per line into sentences
+
+    @return: list of lists of lines
+    """
+    sentences = []
+    sentence = []
+    with open(file, encoding="utf-8") as f:
+        for line in f:
+            temp = line.strip()
+            if len(temp) == 0:
+                if sentence:
+                    sentences.append(sentence)
+                sentence = []
+            else:
+                sentence.append(temp)
+
+    if sentence:
+        sentences.append(sentence)
+    return sentences
+
+
+def loadCorpus(datafolder):
+    """
+    Reads what every benchmark needs from a dataset folder
+
+    @return Dict: {"train": path, "trainTokens": int, "trainSentences": int,
+                   "dev": [[word]]}
+    """
+    datafolder = Path(datafolder)
+    trainSentences = readCorpus(datafolder / "train")
+    return {
+        "train": datafolder / "train",
+        "trainTokens": countTokens(trainSentences),
+        "trainSentences": len(trainSentences),
+        "dev": readCorpus(datafolder / "dev.in"),
+    }
+
+
+def makeSynthetic(corpus, scale, folder, seed=0):
+    """
+    Writes a corpus scale times the size of corpus to folder, by
+    repeating its train and dev sentences in a shuffled order.
+    The same seed always gives the same files
+
+    @return Dict: same as loadCorpus
+    """
+    rng = random.Random(seed)
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+
+    # the train file is written sentence by sentence, so a large scale
+    # does not hold the whole synthetic corpus in memory
+    trainSentences = readCorpus(corpus["train"])
+    order = list(range(len(trainSentences) * scale))
+    rng.shuffle(order)
+    with open(folder / "train", "w", encoding="utf-8") as f:
+        for i in order:
+            f.write("\n".join(trainSentences[i % len(trainSentences)]))
+            f.write("\n\n")
+
+    dev = corpus["dev"] * scale
+    rng.shuffle(dev)
+
+    return {
+        "train": folder / "train",
+        "trainTokens": corpus["trainTokens"] * scale,
+        "trainSentences": corpus["trainSentences"] * scale,
+        "dev": dev,
+    }
+
+
+def countTokens(sentences):
+    return sum(len(sentence) for sentence in sentences)
+
+
+# Each benchmark does its setup and returns (run, tokens, sentences).
+# run(latencies) does the timed work once, appending the seconds taken
+# by each sentence to latencies when it decodes one sentence at a time
+
+def benchEmissions(corpus):
+    run = lambda latencies: estEmissions(corpus["train"])
+    return run, corpus["trainTokens"], corpus["trainSentences"]
+
+
+def benchTransitions(corpus):
+    run = lambda latencies: estTransitions(corpus["train"])
+    return run, corpus["trainTokens"], corpus["trainSentences"]
+
+
+def benchTransitions2(corpus):
+    run = lambda latencies: estTransitions2(corpus["train"])
+    return run, corpus["trainTokens"], corpus["trainSentences"]
+
+
+def benchCounts(corpus):
+    run = lambda latencies: countCorpus(corpus["train"])
+    return run, corpus["trainTokens"], corpus["trainSentences"]
+
+
+def decodeEach(predict, sentences):
+    """
+    Returns a run function that calls predict on each sentence,
+    timing every call when asked to
+    """
+    def run(latencies):
+        if latencies is None:
+            for sentence in sentences:
+                predict(sentence)
+            return
+
+        for sentence in sentences:
+            start = perf_counter()
+            predict(sentence)
+            latencies.append(perf_counter() - start)
+
+    return run
+
+
+def benchPart2(corpus):
+    table = part2.buildArgmaxTable(estEmissions(corpus["train"]))
+    run = decodeEach(lambda sentence: part2.predictTableList(table, sentence), corpus["dev"])
+    return run, countTokens(corpus["dev"]), len(corpus["dev"])
+
+
+def firstTables(corpus):
+    counts = countCorpus(corpus["train"])
+    return buildTables(estEmissions(None, counts=counts), estTransitions(None, counts=counts),
+                       getDictionary(None, counts=counts))
+
+
+def secondTables(corpus):
+    counts = countCorpus(corpus["train"])
+    return buildTables2(estEmissions(None, counts=counts), estTransitions2(None, counts=counts),
+                        getDictionary(None, counts=counts))
+
+
+def benchPart3(corpus):
+    tables = firstTables(corpus)
+    run = decodeEach(lambda sentence: part3.predictViterbiArray(tables, sentence), corpus["dev"])
+    return run, countTokens(corpus["dev"]), len(corpus["dev"])
+
+
+def benchPart3Candidates(corpus):
+    tables = firstTables(corpus)
+    run = decodeEach(lambda sentence: part3.predictViterbiArray(tables, sentence, candidates=True),
+                     corpus["dev"])
+    return run, countTokens(corpus["dev"]), len(corpus["dev"])
+
+
+def benchPart3Batch(corpus):
+    tables = firstTables(corpus)
+    run = lambda latencies: part3.predictViterbiBatch(tables, corpus["dev"])
+    return run, countTokens(corpus["dev"]), len(corpus["dev"])
+
+
+def benchPart4(corpus):
+    tables = secondTables(corpus)
+    run = decodeEach(lambda sentence: part4.predictViterbiArray(tables, sentence), corpus["dev"])
+    return run, countTokens(corpus["dev"]), len(corpus["dev"])
+
+
+def benchPart4Dense(corpus):
+    tables = secondTables(corpus)
+    run = decodeEach(lambda sentence: part4.predictViterbiArray(tables, sentence, candidates=False),
+                     corpus["dev"])
+    return run, countTokens(corpus["dev"]), len(corpus["dev"])
+
+
+def benchPart4Batch(corpus):
+    tables = secondTables(corpus)
+    run = lambda latencies: part4.predictViterbiBatch(tables, corpus["dev"])
+    return run, countTokens(corpus["dev"]), len(corpus["dev"])
+
+
+def benchPart5Train(corpus):
+    run = lambda latencies: part5.train(corpus["train"], EPOCHS)
+    return run, EPOCHS * corpus["trainTokens"], EPOCHS * corpus["trainSentences"]
+
+
+def benchPart5(corpus):
+    model = part5.buildModel(*part5.train(corpus["train"], EPOCHS))
+    run = decodeEach(lambda sentence: part5.predictSentenceArray(model, sentence), corpus["dev"])
+    return run, countTokens(corpus["dev"]), len(corpus["dev"])
+
+
+def benchPart5Candidates(corpus):
+    model = part5.buildModel(*part5.train(corpus["train"], EPOCHS))
+    model.update(part5.buildCandidateIndex(corpus["train"], model["vocab"]))
+    run = decodeEach(lambda sentence: part5.predictSentenceArray(model, sentence, candidates=True),
+                     corpus["dev"])
+    return run, countTokens(corpus["dev"]), len(corpus["dev"])
+
+
+BENCHMARKS = {
+    "estEmissions": benchEmissions,
+    "estTransitions": benchTransitions,
+    "estTransitions2": benchTransitions2,
+    "countCorpus": benchCounts,
+    "part2": benchPart2,
+    "part3": benchPart3,
+    "part3-candidates": benchPart3Candidates,
+    "part3-batch": benchPart3Batch,
+    "part4": benchPart4,
+    "part4-dense": benchPart4Dense,
+    "part4-batch": benchPart4Batch,
+    "part5-train": benchPart5Train,
+    "part5": benchPart5,
+    "part5-candidates": benchPart5Candidates,
+}
+
+
+def precisionReport(datasets, repeat=3):
+    """
+    Stores the part 3 and part 4 tables of each dataset at every
+    precision and measures their size, batch decoding speed, how
+    many dev tags change from float64 and the dev scores
+
+    @return: list of dicts, one per dataset, decoder and precision
+    """
+    results = []
+    with TemporaryDirectory() as temp:
+        output = Path(temp) / "dev.out"
+        for ds in datasets:
+            corpus = loadCorpus(ds)
+            tokens = countTokens(corpus["dev"])
+            decoders = [("part3-batch", firstTables(corpus), part3.predictViterbiBatch),
+                        ("part4-batch", secondTables(corpus), part4.predictViterbiBatch)]
+
+            for name, tables, predict in decoders:
+                exact = predict(tables, corpus["dev"])
+                for precision in PRECISIONS:
+                    stored = setPrecision(tables, precision)
+
+                    # the first run also dequantizes int16 tables, so it is not timed
+                    sequences = predict(stored, corpus["dev"])
+                    best = None
+                    for _ in range(repeat):
+                        start = perf_counter()
+                        predict(stored, corpus["dev"])
+                        elapsed = perf_counter() - start
+                        if best is None or elapsed < best:
+                            best = elapsed
+
+                    with open(Path(ds) / "dev.in", encoding="utf-8") as lines,\
+                         open(output, "w", encoding="utf-8") as out:
+                        tagLines(stored, lines, out)
+                    score = evaluateFiles(Path(ds) / "dev.out", output)
+
+                    changed = sum(a != b for sequence, other in zip(sequences, exact)
+                                  for a, b in zip(sequence, other))
+                    result = {
+                        "benchmark": name,
+                        "dataset": ds,
+                        "precision": precision,
+                        "tableMB": sum(stored[table].nbytes for table in LOG_TABLES
+                                       if table in stored) / 2 ** 20,
+                        "tokensPerSec": tokens / best,
+                        "tagsChanged": changed / tokens,
+                        "entityF": score["entity"]["f"],
+                        "entityTypeF": score["entityType"]["f"],
+                    }
+                    results.append(result)
+                    printPrecision(result)
+
+    return results
+
+
+def printPrecision(result):
+    print("{:<12} {:<3} {:<8} {:>9.3f} {:>12.0f} {:>9.4f} {:>9.4f} {:>9.4f}".format(
+        result["benchmark"], result["dataset"], result["precision"], result["tableMB"],
+        result["tokensPerSec"], result["tagsChanged"], result["entityF"], result["entityTypeF"]))
+
+
+def percentileMs(latencies, q):
+    """
+    Returns the q-th percentile of latencies in milliseconds,
+    or None for benchmarks that do not time sentences
+    """
+    return float(np.percentile(latencies, q)) * 1000 if latencies else None
+
+
+def runBenchmark(name, corpus, repeat=3):
+    """
+    Runs one benchmark. A first run under tracemalloc measures peak
+    memory and warms up, then the fastest of repeat timed runs is kept
+
+    @return Dict: speed, memory and latency of the benchmark
+    """
+    run, tokens, sentences = BENCHMARKS[name](corpus)
+
+    tracemalloc.start()
+    run(None)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    best = None
+    latencies = []
+    for _ in range(repeat):
+        times = []
+        start = perf_counter()
+        run(times)
+        elapsed = perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+        latencies += times
+
+    return {
+        "benchmark": name,
+        "seconds": best,
+        "tokens": tokens,
+        "sentences": sentences,
+        "tokensPerSec": tokens / best,
+        "sentencesPerSec": sentences / best,
+        "peakMemoryMB": peak / 2 ** 20,
+        "latencyMs": {
+            "p50": percentileMs(latencies, 50),
+            "p90": percentileMs(latencies, 90),
+            "p99": percentileMs(latencies, 99),
+            "max": percentileMs(latencies, 100),
+        },
+    }
+
+
+def runSuite(datasets, names, scales=(), repeat=3):
+    """
+    Runs every benchmark in names on each dataset, then on synthetic
+    copies of the last dataset scale times its size
+
+    @return: list of outputs from runBenchmark with dataset and scale added
+    """
+    results = []
+    corpora = [(ds, 1, loadCorpus(ds)) for ds in datasets]
+
+    with TemporaryDirectory() as temp:
+        for ds, scale, corpus in corpora + [(datasets[-1], scale, None) for scale in scales]:
+            if corpus is None:
+                corpus = makeSynthetic(corpora[-1][2], scale, Path(temp) / "{}x{}".format(ds, scale))
+
+            for name in names:
+                result = runBenchmark(name, corpus, repeat)
+                result["dataset"] = ds
+                result["scale"] = scale
+                results.append(result)
+                printResult(result)
+
+    return results
+
+
+def machineInfo():
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def printResult(result):
+    latency = result["latencyMs"]
+    print("{:<16} {:<3} {:>4}x {:>12.0f} {:>10.0f} {:>9.1f} {:>9} {:>9}".format(
+        result["benchmark"], result["dataset"], result["scale"], result["tokensPerSec"],
+        result["sentencesPerSec"], result["peakMemoryMB"],
+        "-" if latency["p50"] is None else "{:.3f}".format(latency["p50"]),
+        "-" if latency["p99"] is None else "{:.3f}".format(latency["p99"])))
+
+
+def compareBaseline(results, baseline, tolerance=TOLERANCE):
+    """
+    Prints the speed of each result relative to the same benchmark,
+    dataset and scale in baseline
+
+    @param baseline: results loaded from an earlier run's JSON output
+    @return: number of benchmarks slower than baseline by more than tolerance
+    """
+    previous = {(r["benchmark"], r["dataset"], r["scale"]): r for r in baseline["results"]}
+    regressions = 0
+
+    print()
+    print("{:<16} {:<3} {:>5} {:>12} {:>12} {:>8}".format(
+        "", "", "scale", "baseline", "now", "ratio"))
+    for result in results:
+        old = previous.get((result["benchmark"], result["dataset"], result["scale"]))
+        if old is None:
+            continue
+
+        ratio = result["tokensPerSec"] / old["tokensPerSec"]
+        slower = ratio < 1 - tolerance
+        regressions += slower
+        print("{:<16} {:<3} {:>4}x {:>12.0f} {:>12.0f} {:>7.2f}x{}".format(
+            result["benchmark"], result["dataset"], result["scale"], old["tokensPerSec"],
+            result["tokensPerSec"], ratio, "  slower" if slower else ""))
+
+    return regressions
+
+
+def main(argv=None):
+    """
+    Runs the benchmarks asked for by argv, the arguments after
+    python bench.py, or by sys.argv if not given
+    """
+    parser = argparse.ArgumentParser(description="Times training and decoding on each dataset")
+    parser.add_argument("datasets", nargs="*", default=DATASETS, help="dataset folders, default all")
+    parser.add_argument("--only", default=",".join(BENCHMARKS),
+                        help="comma separated benchmarks: " + ", ".join(BENCHMARKS))
+    parser.add_argument("--scale", default="",
+                        help="comma separated sizes of synthetic copies of the last dataset, e.g. 10,100")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs of each benchmark")
+    parser.add_argument("--output", default="bench_results.json", help="JSON file to write")
+    parser.add_argument("--baseline", help="JSON output of an earlier run to compare against")
+    parser.add_argument("--precision", action="store_true",
+                        help="instead compare part 3 and 4 tables stored as " + ", ".join(PRECISIONS))
+    args = parser.parse_args(argv)
+
+    if args.precision:
+        print("{:<12} {:<3} {:<8} {:>9} {:>12} {:>9} {:>9} {:>9}".format(
+            "", "", "", "table MB", "tokens/sec", "changed", "entity F", "type F"))
+        results = precisionReport(args.datasets, args.repeat)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"machine": machineInfo(), "results": results}, f, indent=2)
+        print("Output:", args.output)
+        print("Done!")
+        return
+
+    names = args.only.split(",")
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error("unknown benchmark {}".format(name))
+    scales = [int(scale) for scale in args.scale.split(",") if scale]
+
+    print("{:<16} {:<3} {:>5} {:>12} {:>10} {:>9} {:>9} {:>9}".format(
+        "", "", "scale", "tokens/sec", "sents/sec", "peak MB", "p50 ms", "p99 ms"))
+    results = runSuite(args.datasets, names, scales, args.repeat)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"machine": machineInfo(), "epochs": EPOCHS, "results": results}, f, indent=2)
+    print("Output:", args.output)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            if compareBaseline(results, json.load(f)):
+                sys.exit(1)
+
+    print("Done!")
+
+
+# main
+# python bench.py runs every benchmark on every dataset,
+# see python bench.py --help for choosing benchmarks and scales
+if __name__ == "__main__":
+    main()
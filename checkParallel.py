@@ -0,0 +1,61 @@
+from io import StringIO
+from tempfile import TemporaryDirectory
+import os
+import sys
+from modelFile import loadModel
+from tagger import tagLines, tagFileParallel
+
+# inputs tagged both ways, each with line breaks or blank lines
+# that read differently as bytes than as text
+CASES = {
+    "lf": "hello\nworld\n\nthe\ncat\n\n\nsat\n",
+    "crlf": "hello\r\nworld\r\n\r\nthe\r\ncat\r\n\r\n\r\nsat\r\n",
+    "cr": "hello\rworld\r\rthe\r\ncat\r\r\n\nsat\n",
+    "whitespace lines": "hello\n  \nworld\n\nthe\n\t\ncat\n\n",
+    "unicode breaks": "a\u2028b\nc\x85d\n\ne\x0bf\ng\x0ch\n\n",
+    "no last blank line": "hello\nworld\n\nthe\ncat",
+}
+
+
+def checkParallel(modelPath, workers=2, chunkSize=1):
+    """
+    Tags each of CASES with tagFileParallel and with tagLines on the
+    file read as text, and returns the names of the cases whose outputs
+    differ. Small chunks put a cut after almost every sentence
+
+    @return List: names of the failing cases, empty if all match
+    """
+    model = loadModel(modelPath)
+    failed = []
+    with TemporaryDirectory() as folder:
+        for name, data in CASES.items():
+            inputFile = os.path.join(folder, name + ".in")
+            outputFile = os.path.join(folder, name + ".out")
+            with open(inputFile, "wb") as f:
+                f.write(data.encode("utf-8"))
+
+            expected = StringIO()
+            with open(inputFile, encoding="utf-8") as lines:
+                tagLines(model, lines, expected)
+            tagFileParallel(modelPath, inputFile, outputFile, workers, chunkSize)
+            with open(outputFile, encoding="utf-8", newline="") as f:
+                if f.read() != expected.getvalue():
+                    failed.append(name)
+
+    return failed
+
+
+# main
+# python checkParallel.py EN/model.p3 checks that parallel tagging gives
+# the same output as a sequential run
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python checkParallel.py [model file] ...")
+        sys.exit()
+
+    failed = []
+    for modelPath in sys.argv[1:]:
+        failed += ["{} ({})".format(name, modelPath) for name in checkParallel(modelPath)]
+
+    print("Parallel output differs for:", ", ".join(failed) if failed else "none")
+    sys.exit(1 if failed else 0)
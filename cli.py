@@ -0,0 +1,217 @@
+from pathlib import Path
+import argparse
+import sys
+import instrument
+
+# part trained by each train subcommand, and the file name of its model
+PARTS = {"2": "model.p2", "3": "model.p3", "4": "model.p4", "5": "model.p5"}
+
+# training epochs of part 5 when --epochs is not given, as in part5.py
+EPOCHS = 20
+DATASET_EPOCHS = {"FR": 23}
+
+# Each subcommand imports only the modules it needs, so tagging a few
+# sentences does not load the training code and the other way round
+
+
+def trainModel(part, trainFile, k=1, epochs=20, schedule="inverse", precision="float64"):
+    """
+    Trains the model of a part on trainFile, the same model
+    python partN.py saves
+
+    @param part: "2", "3", "4" or "5"
+    @param k: same as in estEmissions, for parts 2 to 4
+    @param epochs: training epochs of part 5
+    @param schedule: learning rate schedule of part 5, from part5.SCHEDULES
+    @param precision: same as in buildTables, for parts 3 and 4
+
+    @return Dict: model that can be saved with saveModel
+    """
+    if part == "5":
+        import part5
+        model = part5.buildModel(*part5.train(trainFile, epochs, schedule=schedule))
+        model.update(part5.buildCandidateIndex(trainFile, model["vocab"]))
+        model["meta"] = {"epochs": epochs}
+        if schedule != "inverse":
+            model["meta"]["schedule"] = schedule
+        return model
+
+    from sharedFunctions import countCorpus, estEmissions, estTransitions, estTransitions2, getDictionary,\
+        buildTables, buildTables2
+
+    counts = countCorpus(trainFile)
+    emissions = estEmissions(trainFile, k, counts)
+    if part == "2":
+        from part2 import buildArgmaxTable
+        model = buildArgmaxTable(emissions)
+    elif part == "3":
+        model = buildTables(emissions, estTransitions(trainFile, counts), getDictionary(trainFile, counts),
+                            precision)
+    else:
+        model = buildTables2(emissions, estTransitions2(trainFile, counts), getDictionary(trainFile, counts),
+                             precision)
+
+    model["meta"] = dict(model.get("meta", {}), k=k)
+    return model
+
+
+def trainCommand(args):
+    """
+    Trains a part on a dataset folder or train file and saves its model
+    """
+    from modelFile import saveModel
+
+    data = Path(args.data)
+    trainFile = data / "train" if data.is_dir() else data
+    modelPath = Path(args.model) if args.model else trainFile.parent / PARTS[args.part]
+
+    epochs = args.epochs
+    if epochs is None:
+        epochs = DATASET_EPOCHS.get(trainFile.parent.name, EPOCHS)
+
+    model = trainModel(args.part, trainFile, args.k, epochs, args.schedule, args.precision)
+    saveModel(modelPath, model)
+    print("Output:", modelPath)
+
+
+def outputPath(input, output=None):
+    """
+    Returns the file tag writes the predictions for input to,
+    input with .tagged appended if output is not given
+
+    @raise ValueError: if the output is input itself or its labelled
+    neighbour, such as dev.out for dev.in
+    """
+    inputPath = Path(input)
+    outputPath = Path(output) if output else inputPath.with_name(inputPath.name + ".tagged")
+
+    protected = [inputPath, inputPath.with_name("train")]
+    if inputPath.suffix == ".in":
+        protected.append(inputPath.with_suffix(".out"))
+    if any(outputPath.resolve() == path.resolve() for path in protected):
+        raise ValueError("refusing to overwrite {}".format(outputPath))
+    return outputPath
+
+
+def tagCommand(args):
+    """
+    Tags a file with a saved model, or stdin one sentence at a time if
+    no input file is given
+    """
+    from modelFile import loadModel
+    from decodeCache import DecodeCache
+    import tagger
+
+    if args.input is None or args.input == "-":
+        cache = DecodeCache(args.cache) if args.cache else None
+        tagger.tagStream(loadModel(args.model), sys.stdin, sys.stdout, cache)
+        if cache is not None:
+            print("Cache:", cache.stats(), file=sys.stderr)
+        return
+
+    output = outputPath(args.input, args.output)
+    if args.workers > 1:
+        tagger.tagFileParallel(args.model, args.input, output, args.workers, args.chunk_size,
+                               args.batch_size, args.cache)
+    else:
+        model = loadModel(args.model)
+        with open(args.input, encoding="utf-8") as lines, open(output, "w", encoding="utf-8") as out:
+            if args.cache:
+                tagger.tagLinesCached(model, lines, out, DecodeCache(args.cache), args.batch_size)
+            else:
+                tagger.tagLines(model, lines, out, args.batch_size)
+    print("Output:", output)
+
+
+def evaluateCommand(args):
+    """
+    Prints the scores of a prediction file against a gold file
+    """
+    from evalResult import evaluateFiles, printResult
+
+    printResult(evaluateFiles(args.gold, args.prediction, args.filter))
+
+
+def benchCommand(args, rest):
+    """
+    Runs bench.py with the arguments after bench
+    """
+    import bench
+
+    bench.main(rest)
+
+
+def buildParser():
+    parser = argparse.ArgumentParser(description="Trains, runs, scores and times the taggers of part 2 to 5")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    commands.required = True
+
+    train = commands.add_parser("train", help="train a part and save its model")
+    train.add_argument("part", choices=sorted(PARTS), help="part whose model is trained")
+    train.add_argument("data", help="dataset folder such as EN, or a train file")
+    train.add_argument("--model", help="model file to write, default model.pN next to train")
+    train.add_argument("--k", type=float, default=1, help="smoothing constant of parts 2 to 4, default 1")
+    train.add_argument("--epochs", type=int,
+                       help="training epochs of part 5, default 23 for FR and 20 otherwise")
+    train.add_argument("--schedule", default="inverse", choices=["inverse", "sqrt", "constant"],
+                       help="learning rate schedule of part 5, default inverse")
+    train.add_argument("--precision", default="float64", choices=["float64", "float32", "int16"],
+                       help="storage of the log tables of parts 3 and 4, default float64")
+    train.set_defaults(run=trainCommand)
+
+    tag = commands.add_parser("tag", help="tag a file or stdin with a saved model")
+    tag.add_argument("model", help="model file saved by train or partN.py")
+    tag.add_argument("input", nargs="?", help="file of unlabelled text, default stdin")
+    tag.add_argument("output", nargs="?", help="file to write, default input with .tagged appended")
+    tag.add_argument("--workers", type=int, default=1, help="processes tagging the input file, default 1")
+    tag.add_argument("--chunk-size", type=int, default=500, help="sentences sent to a worker at a time")
+    tag.add_argument("--batch-size", type=int, help="sentences decoded together by the Viterbi models")
+    tag.add_argument("--cache", type=int, default=0, help="sentences kept in a decode cache, default none")
+    tag.set_defaults(run=tagCommand)
+
+    evaluate = commands.add_parser("evaluate", help="score a prediction file against a gold file")
+    evaluate.add_argument("gold", help="labelled file such as EN/dev.out")
+    evaluate.add_argument("prediction", help="file written by tag")
+    evaluate.add_argument("--filter", action="store_true", help="skip the sentences listed in gold.filter")
+    evaluate.set_defaults(run=evaluateCommand)
+
+    bench = commands.add_parser("bench", help="time training and decoding, see bench --help",
+                                add_help=False)
+    bench.set_defaults(run=benchCommand)
+
+    return parser
+
+
+def main(argv=None):
+    """
+    Runs the subcommand given by argv, the arguments after
+    python cli.py, or by sys.argv if not given
+    """
+    instrument.fromEnvironment()
+    parser = buildParser()
+    args, rest = parser.parse_known_args(argv)
+
+    if args.run is benchCommand:
+        args.run(args, rest)
+        return
+    if rest:
+        parser.error("unrecognized arguments: {}".format(" ".join(rest)))
+
+    if args.command == "train" and args.part not in ("3", "4") and args.precision != "float64":
+        parser.error("--precision only applies to parts 3 and 4")
+    if args.command == "tag" and args.input not in (None, "-"):
+        try:
+            outputPath(args.input, args.output)
+        except ValueError as e:
+            parser.error(str(e))
+    args.run(args)
+
+
+# main
+# python cli.py train 3 EN
+# python cli.py tag EN/model.p3 EN/dev.in EN/dev.p3.out
+# python cli.py evaluate EN/dev.out EN/dev.p3.out
+# python cli.py bench EN --only part3
+# see python cli.py [command] --help for the options of each command
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+from mmap import mmap, ACCESS_READ
+import os
+import random
+import numpy as np
+
+# the sentence index of file is cached next to it as file + INDEX_SUFFIX
+INDEX_SUFFIX = ".idx"
+
+# bumped whenever the index layout changes
+INDEX_VERSION = 1
+
+
+class Corpus:
+    """
+    Memory-maps a train, dev or test file and indexes where each sentence
+    starts, so sentences can be read in any order without scanning the
+    file. A sentence is the lines before a blank line; every blank line
+    ends one, so blank lines in a row give empty sentences like the
+    taggers see. The index is cached next to the file and rebuilt when
+    the file changes
+
+    By default a line of only whitespace ends a sentence, as when counting
+    a train file. With strict, only a line that is empty once its line
+    break is removed does, which is where the taggers end a sentence
+    """
+
+    def __init__(self, file, cache=True, strict=False):
+        self.file = str(file)
+        self.strict = strict
+        with open(self.file, "rb") as f:
+            # mmap cannot map an empty file
+            self.data = mmap(f.fileno(), 0, access=ACCESS_READ) if os.path.getsize(self.file) else b""
+
+        self.starts, self.ends, self.stops = self.loadIndex() if cache else self.buildIndex()
+
+    def buildIndex(self):
+        """
+        Finds every sentence by scanning the file once
+
+        @return Tuple: (starts, ends, stops) arrays of byte offsets, where
+        sentence i is data[starts[i]:ends[i]] and its blank line ends at stops[i]
+        """
+        starts = []
+        ends = []
+        stops = []
+        begin = 0
+        offset = 0
+        data = self.data
+        size = len(data)
+
+        while offset < size:
+            newline = data.find(b"\n", offset)
+            end = size if newline < 0 else newline + 1
+
+            # sentence has ended
+            if self.isBoundary(data[offset:end]):
+                starts.append(begin)
+                ends.append(offset)
+                stops.append(end)
+                begin = end
+            offset = end
+
+        # a last sentence with no blank line after it
+        if begin < size:
+            starts.append(begin)
+            ends.append(size)
+            stops.append(size)
+
+        return (np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64),
+                np.array(stops, dtype=np.int64))
+
+    def isBoundary(self, line):
+        """
+        Returns whether line, the bytes up to and including a newline,
+        ends a sentence
+        """
+        if not self.strict:
+            return len(line.strip()) == 0
+        # read as text, "\r\n" and "\r" are line breaks too, so "a\r\r\n" ends in an empty line
+        return line in (b"\n", b"\r\n") or line.endswith(b"\r\r\n")
+
+    def loadIndex(self):
+        """
+        Returns the cached index if it belongs to the file as it is now,
+        otherwise builds it and tries to cache it
+        """
+        stat = os.stat(self.file)
+        stamp = [INDEX_VERSION, stat.st_size, stat.st_mtime_ns]
+        indexFile = self.file + (".strict" if self.strict else "") + INDEX_SUFFIX
+
+        try:
+            index = np.load(indexFile)
+            if index[:3].tolist() == stamp:
+                return tuple(index[3:].reshape(3, -1))
+        except (OSError, ValueError):
+            pass
+
+        starts, ends, stops = self.buildIndex()
+        try:
+            temp = "{}.{}.tmp.npy".format(indexFile, os.getpid())
+            np.save(temp, np.concatenate([stamp, starts, ends, stops]).astype(np.int64))
+            os.replace(temp, indexFile)
+        except OSError:
+            pass
+
+        return starts, ends, stops
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, i):
+        """
+        Returns the bytes of sentence i, without its blank line, as a
+        memoryview into the file
+        """
+        return memoryview(self.data)[self.starts[i]:self.ends[i]]
+
+    def __iter__(self):
+        """
+        Yields every sentence as a memoryview, without copying it
+        """
+        view = memoryview(self.data)
+        for start, end in zip(self.starts.tolist(), self.ends.tolist()):
+            yield view[start:end]
+
+    def lines(self, i):
+        """
+        Returns the stripped lines of sentence i, such as "word tag"
+        """
+        return [line.strip() for line in str(self[i], "utf-8").splitlines()]
+
+    def text(self, first, last):
+        """
+        Returns sentences first to last - 1 with their blank lines,
+        exactly as they are in the file
+        """
+        if first >= last:
+            return ""
+        return str(self.data[self.starts[first]:self.stops[last - 1]], "utf-8")
+
+    def chunks(self, n):
+        """
+        Cuts the corpus into at most n runs of whole sentences with
+        about the same number of bytes each
+
+        @return List: [(first, last)] sentence ranges covering the corpus in order
+        """
+        if len(self) == 0:
+            return []
+
+        # the first sentence starting at or after each even byte cut
+        size = int(self.stops[-1])
+        cuts = np.searchsorted(self.starts, [size * i // n for i in range(1, n)])
+        bounds = [0] + sorted(set(cuts.tolist()) - {0, len(self)}) + [len(self)]
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def byteRange(self, first, last):
+        """
+        Returns the byte offsets holding sentences first to last - 1
+        and their blank lines
+        """
+        return int(self.starts[first]), int(self.stops[last - 1])
+
+    def sample(self, k, seed=None):
+        """
+        Returns the lines of k sentences picked at random, reading
+        only those sentences
+        """
+        picks = random.Random(seed).sample(range(len(self)), min(k, len(self)))
+        return [self.lines(i) for i in picks]
+
+    def close(self):
+        if isinstance(self.data, mmap):
+            self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,111 @@
+from collections import OrderedDict
+import sys
+import instrument
+
+# sentences kept when no size is given
+CACHE_SIZE = 10000
+
+
+class DecodeCache:
+    """
+    Least recently used cache of predicted tag sequences. Sentences are
+    keyed by their word ids, so sentences that differ only in case or in
+    words the model has never seen share an entry, and by the version of
+    the model they were decoded with. Binding a model with a different
+    meta["version"], as OnlineModel.tables() gives after an update, or
+    a different model object, as happens when a model is reloaded,
+    empties the cache
+    """
+
+    def __init__(self, maxEntries=CACHE_SIZE, maxBytes=None):
+        """
+        @param maxEntries: most sentences kept
+        @param maxBytes: if given, most bytes the keys and tag lists may take
+        """
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.model = None
+        self.modelVersion = None
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def bind(self, model):
+        """
+        Makes model the one cached results belong to, emptying the
+        cache if it was holding results of another model
+        """
+        modelVersion = model.get("meta", {}).get("version")
+        if model is not self.model or modelVersion != self.modelVersion:
+            self.clear()
+            self.model = model
+            self.modelVersion = modelVersion
+            self.version += 1
+
+    def key(self, sentence):
+        """
+        Returns the key of a list of words for the bound model
+        """
+        return self.version, tuple(self.model["vocab"].encode(sentence))
+
+    def get(self, key):
+        """
+        Returns the cached tags for key, or None
+        """
+        tags = self.entries.get(key)
+        if tags is None:
+            self.misses += 1
+            instrument.count("cache.misses")
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        instrument.count("cache.hits")
+        return tags
+
+    def put(self, key, tags):
+        """
+        Caches tags for key, evicting the least recently used
+        sentences while the cache is over its bounds
+        """
+        if key in self.entries:
+            return
+
+        self.entries[key] = tags
+        self.bytes += entrySize(key, tags)
+        while len(self.entries) > self.maxEntries or \
+              (self.maxBytes is not None and self.bytes > self.maxBytes and len(self.entries) > 1):
+            oldKey, oldTags = self.entries.popitem(last=False)
+            self.bytes -= entrySize(oldKey, oldTags)
+            self.evictions += 1
+            instrument.count("cache.evictions")
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def stats(self):
+        """
+        @return Dict: size and hit, miss and eviction counts of the cache
+        """
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def entrySize(key, tags):
+    """
+    Returns about how many bytes a cache entry takes. Tag strings are
+    shared with the model, so only the containers are counted
+    """
+    return sys.getsizeof(key) + sys.getsizeof(key[1]) + sys.getsizeof(tags)
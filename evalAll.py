@@ -1,28 +1,69 @@
 from pathlib import Path
+import json
 import sys
-import os
+from evalResult import evaluateFiles, formatResult
+import instrument
 
-# main
-if len(sys.argv) < 2:
-    print("Usage: python evalAll.py [p2/p3/...]")
-    sys.exit()
+DATASETS = ["EN", "FR", "CN", "SG"]
+TASKS = ["p2", "p3", "p4", "p5"]
+
+
+def evaluateAll(tasks, datasets=DATASETS, workers=None):
+    """
+    Scores dev.[task].out against dev.out for every task and dataset,
+    all at once on a pool of processes
+
+    @param tasks: list of parts such as "p2"
+    @param datasets: list of dataset folder names
+    @param workers: number of processes, defaults to the number of CPUs
+
+    @return Dict: {task: {dataset: output from evaluateFiles}}
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    with instrument.timer("evaluateAll"), ProcessPoolExecutor(workers) as pool:
+        futures = {}
+        for task in tasks:
+            for ds in datasets:
+                datafolder = Path(ds)
+                predictFile = datafolder / "dev.{}.out".format(task)
+                testFile = datafolder / "dev.out"
+                futures[task, ds] = pool.submit(evaluateFiles, testFile, predictFile)
 
-task = sys.argv[1]
+        return {task: {ds: futures[task, ds].result() for ds in datasets} for task in tasks}
 
-datasets = ["EN", "FR", "CN", "SG"]
-output = "{}_results".format(task)
 
-with open(output, "w", encoding='utf-8') as f:
-    f.write("{} Results\n\n\n".format(task.upper()))
-    for ds in datasets:
-        datafolder = Path(ds)
-        predictFile = datafolder / "dev.{}.out".format(task)
-        testFile = datafolder / "dev.out"
-        result = os.popen("python3 evalResult.py {} {}".format(testFile, predictFile)).read()
+def writeResults(task, results, output):
+    """
+    Writes the text report of one task to output and its
+    scores as JSON to output.json
+
+    @param results: {dataset: output from evaluateFiles}
+    """
+    with open(output, "w", encoding='utf-8') as f:
+        f.write("{} Results\n\n\n".format(task.upper()))
+        for ds, result in results.items():
+            f.write(ds)
+            f.write(formatResult(result))
+            f.write(40 * "_" + 3 * "\n")
+
+    with open("{}.json".format(output), "w", encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+
+# main
+# python evalAll.py all scores p2 to p5
+if __name__ == "__main__":
+    instrument.fromEnvironment()
+    if len(sys.argv) < 2:
+        print("Usage: python evalAll.py [p2/p3/.../all] ...")
+        sys.exit()
+
+    tasks = TASKS if sys.argv[1:] == ["all"] else sys.argv[1:]
 
-        f.write(ds)
-        f.write(result)
-        f.write(40 * "_" + 3 * "\n")
+    for task, results in evaluateAll(tasks).items():
+        output = "{}_results".format(task)
+        writeResults(task, results, output)
+        print("Output: {}".format(output))
 
-print("Output: {}".format(output))
-print("Done!")
+    print("Done!")
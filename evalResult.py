@@ -1,168 +1,169 @@
 import sys
-import re
-from copy import copy
 from collections import defaultdict
-from optparse import OptionParser
+import instrument
 
-#Read entities from predcition
-def get_predicted(predicted, answers=defaultdict(lambda: defaultdict(defaultdict))):
+#column separator
+SEPARATOR = ' '
+
+#the column index for tags
+OUTPUT_COLUMN_INDEX = 1
+
+#Read entities of each sentence, one sentence at a time
+#Yields {(begin, length): sentiment} for each Instance Index example,
+#entities are contiguous so begin and length identify one
+def read_entities(lines, separator=SEPARATOR, outputColumnIndex=OUTPUT_COLUMN_INDEX):
 
-    example = 0
     word_index = 0
-    entity = []
+    begin = None
+    length = 0
+    entity_sent = ""
     last_ne = "O"
     last_sent = ""
-    last_entity = []
 
-    answers[example] = []
-    for line in predicted:
+    spans = {}
+    for line in lines:
         line = line.strip()
         if line.startswith("##"):
             continue
         elif len(line) == 0:
-            if entity:
-                answers[example].append(list(entity))
-                entity = []
+            if begin is not None:
+                spans[begin, length] = entity_sent
+                begin = None
 
-            example += 1
-            answers[example] = []
+            yield spans
+            spans = {}
             word_index = 0
             last_ne = "O"
             continue
         else:
             split_line = line.split(separator)
-            #word = split_line[0]
             value = split_line[outputColumnIndex]
             ne = value[0]
             sent = value[2:]
 
-
-            last_entity = []
-
             #check if it is start of entity
             if ne == 'B' or (ne == 'I' and last_ne == 'O') or (last_ne != 'O' and ne == 'I' and last_sent != sent):
-                if entity:
-                    last_entity = list(entity)
+                if begin is not None:
+                    spans[begin, length] = entity_sent
 
-                entity = [sent]
-                    
-                entity.append(word_index)
+                begin = word_index
+                length = 1
+                entity_sent = sent
 
             elif ne == 'I':
-                entity.append(word_index)
+                length += 1
 
             elif ne == 'O':
-                if last_ne == 'B' or last_ne == 'I':
-                    last_entity =list(entity)
-                entity = []
-
-
-            if last_entity:
-                answers[example].append(list(last_entity))
-                last_entity = []
+                #Only an entity tagged B or I up to here ends, as in the original script
+                if begin is not None and last_ne in ('B', 'I'):
+                    spans[begin, length] = entity_sent
+                begin = None
 
         last_sent = sent
         last_ne = ne
         word_index += 1
 
-    if entity:
-        answers[example].append(list(entity))
-
-
-    return answers
-
-
-
-#Read entities from gold data
-def get_observed(observed):
-
+    if begin is not None:
+        spans[begin, length] = entity_sent
 
-    example = 0
-    word_index = 0
-    entity = []
-    last_ne = "O"
-    last_sent = ""
-    last_entity = []
+    yield spans
 
-    observations=defaultdict(defaultdict)
-    observations[example] = []
+#Entities as lists of [sentiment, word indexes...]
+def to_entity_lists(spans):
+    return [[sent] + list(range(begin, begin + length)) for (begin, length), sent in spans.items()]
 
-    for line in observed:
-        line = line.strip()
-        if line.startswith("##"):
-            continue
-        elif len(line) == 0:
-            if entity:
-                observations[example].append(list(entity))
-                entity = []
+#Entities as {(begin, length): sentiment}
+def to_spans(instance):
+    return {(entity[1], len(entity) - 1): entity[0] for entity in instance}
 
-            example += 1
-            observations[example] = []
-            word_index = 0
-            last_ne = "O"
-            continue
-
-        else:
-            split_line = line.split(separator)
-            word = split_line[0]
-            value = split_line[outputColumnIndex]
-            ne = value[0]
-            sent = value[2:]
-
-
-            last_entity = []
-
-            #check if it is start of entity, suppose there is no weird case in gold data
-            if ne == 'B' or (ne == 'I' and last_ne == 'O') or (last_ne != 'O' and ne == 'I' and last_sent != sent):
-                if entity:
-                    last_entity = entity
-
-                entity = [sent]
-                    
-                entity.append(word_index)
-
-            elif ne == 'I':
-                entity.append(word_index)
+#Read entities from predcition
+def get_predicted(predicted, answers=None, separator=SEPARATOR, outputColumnIndex=OUTPUT_COLUMN_INDEX):
+    if answers is None:
+        answers = defaultdict(defaultdict)
 
-            elif ne == 'O':
-                if last_ne == 'B' or last_ne == 'I':
-                    last_entity = entity
-                entity = []
+    for example, spans in enumerate(read_entities(predicted, separator, outputColumnIndex)):
+        answers[example] = to_entity_lists(spans)
 
+    return answers
 
-            if last_entity:
-                observations[example].append(list(last_entity))
-                last_entity = []
 
 
-        last_ne = ne
-        last_sent = sent
-        word_index += 1
+#Read entities from gold data
+def get_observed(observed, separator=SEPARATOR, outputColumnIndex=OUTPUT_COLUMN_INDEX):
 
-    if entity:
-        observations[example].append(list(entity))
+    observations=defaultdict(defaultdict)
+    for example, spans in enumerate(read_entities(observed, separator, outputColumnIndex)):
+        observations[example] = to_entity_lists(spans)
 
     return observations
 
-#Print Results and deal with division by 0
-def printResult(evalTarget, num_correct, prec, rec):
+#Precision, recall and F, dealing with division by 0
+def scoreResult(num_correct, total_predicted, total_observed):
+    prec = num_correct / total_predicted if total_predicted else 0.0
+    rec = num_correct / total_observed if total_observed else 0.0
     if abs(prec + rec ) < 1e-6:
         f = 0
     else:
         f = 2 * prec * rec / (prec + rec)
-    print('#Correct', evalTarget, ':', num_correct)
-    print(evalTarget, ' precision: %.4f' % (prec))
-    print(evalTarget, ' recall: %.4f' %   (rec))
-    print(evalTarget, ' F: %.4f' % (f))
+    return {"correct": num_correct, "precision": prec, "recall": rec, "f": f}
+
+#Format Results the way printResult used to print them
+def formatScore(evalTarget, score):
+    return ('#Correct {} : {}\n'.format(evalTarget, score["correct"]) +
+            '{}  precision: {:.4f}\n'.format(evalTarget, score["precision"]) +
+            '{}  recall: {:.4f}\n'.format(evalTarget, score["recall"]) +
+            '{}  F: {:.4f}\n'.format(evalTarget, score["f"]))
+
+#Format the whole report, same text as running this file
+def formatResult(result):
+    return ('\n' +
+            '#Entity in gold data: %d\n' % (result["observed"]) +
+            '#Entity in prediction: %d\n' % (result["predicted"]) +
+            '\n' +
+            formatScore('Entity', result["entity"]) +
+            '\n' +
+            formatScore('Entity Type', result["entityType"]))
+
+#Print Results
+def printResult(result):
+    print(formatResult(result), end='')
+
+#Count entities of one example matched by span, and by span and sentiment
+def match_spans(observed_spans, predicted_spans):
+    correct_entity = 0
+    correct_sentiment = 0
+
+    #For each entity in prediction, look up the gold entity with its span
+    for span_ne, span_sent in predicted_spans.items():
+        sent = observed_spans.get(span_ne)
+
+        #Entity matched
+        if sent is not None:
+            correct_entity += 1
+
+            #Entity & Sentiment both are matched
+            if span_sent == sent:
+                correct_sentiment += 1
+
+    return correct_entity, correct_sentiment
+
+#Scores from the totals over all examples
+def makeResult(correct_entity, correct_sentiment, total_observed, total_predicted):
+    return {
+        "observed": total_observed,
+        "predicted": total_predicted,
+        "entity": scoreResult(correct_entity, total_predicted, total_observed),
+        "entityType": scoreResult(correct_sentiment, total_predicted, total_observed),
+    }
 
 #Compare results bewteen gold data and prediction data
-def compare_observed_to_predicted(observed, predicted):
+def compare_observed_to_predicted(observed, predicted, discardInstance=()):
 
     correct_sentiment = 0
     correct_entity = 0
 
-    total_observed = 0.0
-    total_predicted = 0.0
+    total_observed = 0
+    total_predicted = 0
 
     #For each Instance Index example (example = 0,1,2,3.....)
     for example in observed:
@@ -170,87 +171,81 @@ def compare_observed_to_predicted(observed, predicted):
         if example in discardInstance:
             continue
 
-        observed_instance = observed[example]
-        predicted_instance = predicted[example]
+        observed_spans = to_spans(observed[example])
+        predicted_spans = to_spans(predicted.get(example, ()))
 
         #Count number of entities in gold data
-        total_observed += len(observed_instance)
+        total_observed += len(observed_spans)
         #Count number of entities in prediction data
-        total_predicted += len(predicted_instance)
-
-        #For each entity in prediction
-        for span in predicted_instance:
-            span_begin = span[1]
-            span_length = len(span) - 1
-            span_ne = (span_begin, span_length)
-            span_sent = span[0]
-
-            #For each entity in gold data
-            for observed_span in observed_instance:
-                begin = observed_span[1]
-                length = len(observed_span) - 1
-                ne = (begin, length)
-                sent = observed_span[0]
-
-                #Entity matched
-                if span_ne == ne:
-                    correct_entity += 1
+        total_predicted += len(predicted_spans)
 
+        entity, sentiment = match_spans(observed_spans, predicted_spans)
+        correct_entity += entity
+        correct_sentiment += sentiment
 
-                    #Entity & Sentiment both are matched
-                    if span_sent == sent:
-                        correct_sentiment += 1
+    return makeResult(correct_entity, correct_sentiment, total_observed, total_predicted)
 
-    print()
-    print('#Entity in gold data: %d' % (total_observed))
-    print('#Entity in prediction: %d' % (total_predicted))
-    print()
+#Same as compare_observed_to_predicted, but reads gold and prediction
+#lines in step, holding one sentence of each in memory
+def compare_lines(gold, prediction, discardInstance=()):
 
-    prec = correct_entity/total_predicted
-    rec = correct_entity/total_observed
-    printResult('Entity', correct_entity, prec, rec)
-    print()
+    correct_sentiment = 0
+    correct_entity = 0
 
-    prec = correct_sentiment/total_predicted
-    rec = correct_sentiment/total_observed
-    printResult('Entity Type',correct_sentiment, prec, rec)
+    total_observed = 0
+    total_predicted = 0
 
+    predicted = read_entities(prediction)
+    for example, observed_spans in enumerate(read_entities(gold)):
+        #Prediction with fewer sentences than gold has no entities in the rest
+        predicted_spans = next(predicted, {})
 
+        if example in discardInstance:
+            continue
 
+        total_observed += len(observed_spans)
+        total_predicted += len(predicted_spans)
 
-##############Main Function##################
+        entity, sentiment = match_spans(observed_spans, predicted_spans)
+        correct_entity += entity
+        correct_sentiment += sentiment
 
-if len(sys.argv) < 3:
-    print ('Please make sure you have installed Python 3.4 or above!')
-    print ("Usage on Windows:  python evalResult.py [gold file] [prediction file]")
-    print ("Usage on Linux/Mac:  python3 evalResult.py [gold file] [prediction file]")
-    sys.exit()
+    return makeResult(correct_entity, correct_sentiment, total_observed, total_predicted)
 
-gold = open(sys.argv[1], "r", encoding="utf-8")
-prediction = open(sys.argv[2], "r", encoding="utf-8")
-discardInstance = []
+#Read the instance ids listed in the .filter file next to gold
+def readFilter(goldFile):
+    discardInstance = set()
+    with open(str(goldFile) + '.filter', "r", encoding="utf-8") as filterInst_file:
+        for line in filterInst_file:
+            line = line.strip('\n')
+            line = line.strip('\r')
+            discardInstance.add(int(line))
+    return discardInstance
 
+#Score a prediction file against a gold file
+#Returns {"observed", "predicted", "entity", "entityType"}, where the
+#last two hold "correct", "precision", "recall" and "f"
+def evaluateFiles(goldFile, predictionFile, filter=False):
+    discardInstance = readFilter(goldFile) if filter else ()
 
-if len(sys.argv) > 3 and sys.argv[3] == 'filter':
-    filterInst_file = open(sys.argv[1] + '.filter', "r", encoding="utf-8")
-    for line in filterInst_file:
-        line = line.strip('\n')
-        line = line.strip('\r')
-        instID = int(line)
-        discardInstance.append(instID)
+    with instrument.timer("evaluate"),\
+         open(goldFile, "r", encoding="utf-8") as gold,\
+         open(predictionFile, "r", encoding="utf-8") as prediction:
+        #Read and compare both in one pass
+        return compare_lines(gold, prediction, discardInstance)
 
 
-#column separator
-separator = ' '
 
-#the column index for tags
-outputColumnIndex = 1
-#Read Gold data
-observed = get_observed(gold)
 
-#Read Predction data
-predicted = get_predicted(prediction)
+##############Main Function##################
 
-#Compare
-compare_observed_to_predicted(observed, predicted)
+if __name__ == "__main__":
+    instrument.fromEnvironment()
+    if len(sys.argv) < 3:
+        print ('Please make sure you have installed Python 3.4 or above!')
+        print ("Usage on Windows:  python evalResult.py [gold file] [prediction file]")
+        print ("Usage on Linux/Mac:  python3 evalResult.py [gold file] [prediction file]")
+        sys.exit()
 
+    filter = len(sys.argv) > 3 and sys.argv[3] == 'filter'
+    printResult(evaluateFiles(sys.argv[1], sys.argv[2], filter))
@@ -0,0 +1,247 @@
+from math import ceil, floor, log2
+from time import perf_counter
+import atexit
+import cProfile
+import json
+import os
+import sys
+
+# set HMM_INSTRUMENT=1 to print a report to stderr when a script ends,
+# or HMM_INSTRUMENT=file.json to write it as JSON
+INSTRUMENT_VARIABLE = "HMM_INSTRUMENT"
+
+# set HMM_PROFILE=file.prof to run a script under cProfile
+PROFILE_VARIABLE = "HMM_PROFILE"
+
+# when False, timer returns a shared no-op context and callers skip
+# their counting, so instrumented code runs at full speed
+enabled = False
+
+# {name: [calls, seconds]}
+timers = {}
+
+# {name: total}
+counters = {}
+
+# histograms keep counts in buckets a fraction of a doubling wide, not
+# every value, so their memory stays fixed however long a script runs
+BUCKETS_PER_DOUBLING = 8
+
+# smallest value told apart from 0, such as one nanosecond
+SMALLEST_VALUE = 1e-9
+
+# {name: [count, total, max, {bucket: count}]}
+histograms = {}
+
+
+class NullTimer:
+    """
+    Context that does nothing, returned by timer when disabled.
+    contextlib.nullcontext would need Python 3.7
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+# context returned by timer when disabled
+NULL_TIMER = NullTimer()
+
+
+class Timer:
+    """
+    Adds the time spent inside a with block to timers[name]
+    """
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = perf_counter() - self.start
+        entry = timers.setdefault(self.name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += elapsed
+        observe(self.name, elapsed)
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    """
+    Forgets everything recorded so far
+    """
+    timers.clear()
+    counters.clear()
+    histograms.clear()
+
+
+def timer(name):
+    """
+    Returns a context that times its with block as name.
+    Every timed block is also added to the histogram of name
+    """
+    return Timer(name) if enabled else NULL_TIMER
+
+
+def count(name, n=1):
+    """
+    Adds n to counters[name]
+    """
+    if enabled:
+        counters[name] = counters.get(name, 0) + n
+
+
+def observe(name, value):
+    """
+    Adds value, such as the seconds one sentence took, to histograms[name]
+    """
+    if enabled:
+        entry = histograms.get(name)
+        if entry is None:
+            entry = histograms[name] = [0, 0.0, value, {}]
+        entry[0] += 1
+        entry[1] += value
+        entry[2] = max(entry[2], value)
+        index = floor(log2(max(value, SMALLEST_VALUE)) * BUCKETS_PER_DOUBLING)
+        entry[3][index] = entry[3].get(index, 0) + 1
+
+
+def countWords(lines, part, known):
+    """
+    Passes lines through unchanged, counting sentences, words and words
+    not in known as part.sentences, part.tokens and part.unk. Wrapping
+    lines only when enabled keeps the tagging loop itself untouched
+
+    @param known: container of the lowercased words seen in training
+    """
+    for line in lines:
+        word = line.strip()
+        if word:
+            count(part + ".tokens")
+            if word.lower() not in known:
+                count(part + ".unk")
+        else:
+            count(part + ".sentences")
+        yield line
+
+
+def percentile(entry, q):
+    """
+    Returns the q-th percentile of a histogram by nearest rank, as the
+    upper edge of the bucket holding it, so within one bucket width
+    """
+    total, _, largest, buckets = entry
+    rank = max(1, ceil(total * q / 100))
+    seen = 0
+    for index in sorted(buckets):
+        seen += buckets[index]
+        if seen >= rank:
+            return min(2 ** ((index + 1) / BUCKETS_PER_DOUBLING), largest)
+    return largest
+
+
+def report():
+    """
+    Returns everything recorded so far
+
+    @return Dict: {"timers": {name: {"calls", "seconds"}},
+                   "counters": {name: total},
+                   "rates": {name: value},
+                   "histograms": {name: {"count", "mean", "p50", "p90", "p99", "max"}}}
+    """
+    summary = {}
+    for name, entry in histograms.items():
+        summary[name] = {
+            "count": entry[0],
+            "mean": entry[1] / entry[0],
+            "p50": percentile(entry, 50),
+            "p90": percentile(entry, 90),
+            "p99": percentile(entry, 99),
+            "max": entry[2],
+        }
+
+    # fraction of tagged words that were not in train, for each part
+    rates = {}
+    for name, total in counters.items():
+        if name.endswith(".unk"):
+            tokens = counters.get(name[:-len("unk")] + "tokens")
+            if tokens:
+                rates[name + "Rate"] = total / tokens
+
+    return {
+        "timers": {name: {"calls": calls, "seconds": seconds}
+                   for name, (calls, seconds) in timers.items()},
+        "counters": dict(counters),
+        "rates": rates,
+        "histograms": summary,
+    }
+
+
+def printReport(out=sys.stderr):
+    """
+    Prints the output of report as tables
+    """
+    result = report()
+
+    print("{:<28} {:>8} {:>10}".format("timer", "calls", "seconds"), file=out)
+    for name, timed in result["timers"].items():
+        print("{:<28} {:>8} {:>10.4f}".format(name, timed["calls"], timed["seconds"]), file=out)
+
+    print("\n{:<28} {:>12}".format("counter", "total"), file=out)
+    for name, total in list(result["counters"].items()) + list(result["rates"].items()):
+        print("{:<28} {:>12}".format(name, total if isinstance(total, int) else "{:.4f}".format(total)),
+              file=out)
+
+    print("\n{:<28} {:>8} {:>10} {:>10} {:>10} {:>10}".format(
+        "histogram (ms)", "count", "p50", "p90", "p99", "max"), file=out)
+    for name, summary in result["histograms"].items():
+        print("{:<28} {:>8} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f}".format(
+            name, summary["count"], summary["p50"] * 1000, summary["p90"] * 1000,
+            summary["p99"] * 1000, summary["max"] * 1000), file=out)
+
+
+def writeReport(file):
+    """
+    Saves the output of report as JSON
+    """
+    with open(file, "w", encoding="utf-8") as f:
+        json.dump(report(), f, indent=2)
+
+
+def fromEnvironment():
+    """
+    Turns on instrumentation and profiling as HMM_INSTRUMENT and
+    HMM_PROFILE ask, reporting when the script ends. Called by
+    the main of each script, so importing a module never does it
+    """
+    target = os.environ.get(INSTRUMENT_VARIABLE)
+    if target:
+        enable()
+        if target == "1":
+            atexit.register(printReport)
+        else:
+            atexit.register(writeReport, target)
+
+    file = os.environ.get(PROFILE_VARIABLE)
+    if file:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        atexit.register(profiler.dump_stats, file)
+        atexit.register(profiler.disable)
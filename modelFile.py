@@ -0,0 +1,121 @@
+import json
+import os
+import struct
+import numpy as np
+from vocabulary import Vocabulary
+
+MAGIC = b"HMMMODEL"
+ALIGN = 64
+
+# bumped whenever the header or array layout changes
+VERSION = 2
+
+
+def saveModel(file, model):
+    """
+    Saves a model to a single binary file that loadModel can memory-map.
+    The file is MAGIC, the header length, a JSON header with the tags,
+    words and array layout, then every array as raw bytes aligned to
+    ALIGN bytes
+
+    @param file: name of file to save the model to
+    @param model: dict with "kind" and "vocab" keys, numpy arrays
+    for the tables and an optional "meta" dict of JSON values
+    """
+    vocab = model["vocab"]
+    arrays = {name: np.ascontiguousarray(value) for name, value in model.items()
+              if isinstance(value, np.ndarray)}
+
+    # lay out arrays after the header, offsets are relative to the data start
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += -(-array.nbytes // ALIGN) * ALIGN
+
+    header = json.dumps({
+        "version": VERSION,
+        "kind": model["kind"],
+        "tags": vocab.tags,
+        "words": vocab.words,
+        "meta": model.get("meta", {}),
+        "arrays": layout,
+    }, ensure_ascii=False).encode("utf-8")
+    start = -(-(len(MAGIC) + 8 + len(header)) // ALIGN) * ALIGN
+    header += b" " * (start - len(MAGIC) - 8 - len(header))
+
+    # write next to file and rename, so a process that has the old
+    # file memory-mapped or is loading it never sees a partial model
+    temp = "{}.{}.tmp".format(file, os.getpid())
+    with open(temp, "wb") as out:
+        out.write(MAGIC)
+        out.write(struct.pack("<Q", len(header)))
+        out.write(header)
+        for name, array in arrays.items():
+            out.seek(start + layout[name]["offset"])
+            out.write(array.tobytes())
+        out.truncate(start + offset)
+    os.replace(temp, file)
+
+
+def loadModel(file):
+    """
+    Loads a model saved by saveModel. The arrays are read-only views
+    into a memory-map of the file, so processes loading the same file
+    share its pages. They are plain ndarrays rather than np.memmap,
+    which would wrap the result of every operation in a decoder loop
+
+    @param file: name of file the model was saved to
+
+    @return Dict: same keys as the model that was saved
+    """
+    header, start = readHeader(file)
+    if header is None or header.get("version") != VERSION:
+        raise ValueError("{} is not a version {} model file".format(file, VERSION))
+
+    buffer = np.memmap(file, dtype=np.uint8, mode="r")
+
+    model = {
+        "kind": header["kind"],
+        "vocab": Vocabulary(header["words"], header["tags"]),
+        "meta": header["meta"],
+    }
+    for name, layout in header["arrays"].items():
+        dtype = np.dtype(layout["dtype"])
+        begin = start + layout["offset"]
+        end = begin + dtype.itemsize * int(np.prod(layout["shape"]))
+        model[name] = buffer[begin:end].view(dtype).reshape(layout["shape"]).view(np.ndarray)
+
+    return model
+
+
+def readHeader(file):
+    """
+    Reads the JSON header of a model file
+
+    @return Tuple: (header dict, offset of the first array), or
+    (None, 0) if file is not a model file
+    """
+    with open(file, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            return None, 0
+        size = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(size).decode("utf-8"))
+
+    return header, len(MAGIC) + 8 + size
+
+
+def isFresh(file, trainFile):
+    """
+    Returns whether a saved model of the current version exists
+    and is newer than its training file
+    """
+    try:
+        header, _ = readHeader(file)
+    except (OSError, ValueError):
+        return False
+
+    if header is None or header.get("version") != VERSION:
+        return False
+
+    return os.path.getmtime(file) >= os.path.getmtime(trainFile)
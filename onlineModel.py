@@ -0,0 +1,350 @@
+from math import log
+from pathlib import Path
+import sys
+import numpy as np
+from sharedFunctions import countLines, mergeCounts, estEmissions, estTransitions, estTransitions2,\
+    getDictionary, buildTables, buildTables2, buildCandidates, emitting
+from modelFile import saveModel, loadModel
+from vocabulary import UNK, UNK_ID, START, STOP
+import instrument
+
+
+class OnlineModel:
+    """
+    HMM that keeps the raw counts it was trained on, so labelled sentences
+    can be added at any time without reading the old ones again. Adding
+    sentences only merges their counts; the log tables of the tags and
+    histories they touched are recomputed the next time tables() is
+    called. The tables are exactly what buildTables or buildTables2 would
+    give for all the sentences added so far. Each model tables() returns
+    has its own vocabulary, so adding words later cannot make its
+    vocabulary and emission rows disagree
+    """
+
+    def __init__(self, kind="first", k=1, counts=None):
+        """
+        @param kind: "first" for part3's model, "second" for part4's
+        @param k: same as in estEmissions
+        @param counts: output from countLines function, taken over
+        """
+        if kind not in ("first", "second"):
+            raise ValueError("Unknown model kind {}".format(kind))
+
+        self.kind = kind
+        self.k = k
+        self.counts = countLines([]) if counts is None else counts
+
+        # bumped each time tables() gives out changed tables, and kept in
+        # their meta["version"] so caches can tell them apart
+        self.version = 0
+        self.rebuild()
+
+    @classmethod
+    def fromModel(cls, model):
+        """
+        Resumes from a model saved by snapshot
+
+        @param model: output from loadModel function
+        """
+        if "emissionCounts" not in model:
+            raise ValueError("model was not saved by OnlineModel.snapshot")
+
+        return cls(model["kind"], model["meta"]["k"], arraysToCounts(model))
+
+    def rebuild(self):
+        """
+        Recomputes every table from the counts, needed when a new tag appears
+        """
+        counts = self.counts
+        emissions = estEmissions(None, self.k, counts)
+        if self.kind == "first":
+            tables = buildTables(emissions, estTransitions(None, counts), getDictionary(None, counts))
+        else:
+            tables = buildTables2(emissions, estTransitions2(None, counts), getDictionary(None, counts))
+
+        self.model = tables
+        self.vocab = tables["vocab"]
+
+        # emission rows are allocated ahead, so new words rarely copy the table
+        self.logE = np.full((2 * len(self.vocab), len(self.vocab.tags)), -np.inf)
+        self.logE[:len(self.vocab)] = tables["emissions"]
+
+        self.dirtyTags = set()
+        self.dirtyHistories = set()
+
+        # model last returned by tables(), handed out again until something changes
+        self.published = None
+
+    def addLines(self, lines):
+        """
+        Adds labelled lines in the format of train. Like train, sentences
+        should end with a blank line
+
+        @return: number of tokens added
+        """
+        with instrument.timer("online.add"):
+            delta = countLines(lines)
+            newTag = any(tag not in self.vocab.tagIds for tag in delta["tags"])
+            mergeCounts(self.counts, delta)
+
+            if newTag:
+                self.rebuild()
+            else:
+                for word in delta["words"]:
+                    self.addWord(word)
+                self.dirtyTags.update(delta["tags"])
+                if self.kind == "first":
+                    self.dirtyHistories.update(delta["transitions"])
+                else:
+                    self.dirtyHistories.update(delta["transitions2"])
+                    self.dirtyHistories.update(delta["histories2"])
+
+        tokens = sum(delta["tags"].values())
+        instrument.count("online.tokens", tokens)
+        return tokens
+
+    def addSentences(self, sentences):
+        """
+        Adds sentences given as lists of (word, tag) pairs
+
+        @return: number of tokens added
+        """
+        lines = []
+        for sentence in sentences:
+            lines += ["{} {}".format(word, tag) for word, tag in sentence]
+            lines.append("")
+        return self.addLines(lines)
+
+    def addWord(self, word):
+        if word in self.vocab:
+            return
+
+        self.vocab.addWord(word)
+        if len(self.vocab) > len(self.logE):
+            grown = np.full((2 * len(self.logE), self.logE.shape[1]), -np.inf)
+            grown[:len(self.logE)] = self.logE
+            self.logE = grown
+
+    def tables(self):
+        """
+        Returns the model in the format of buildTables or buildTables2,
+        recomputing only what was touched since the last call
+
+        @return Dict: same keys as buildTables or buildTables2
+        """
+        if self.published is not None and not self.dirtyTags and not self.dirtyHistories:
+            return self.published
+
+        with instrument.timer("online.refresh"):
+            for tag in self.dirtyTags:
+                self.refreshEmissions(tag)
+            for history in self.dirtyHistories:
+                if self.kind == "first":
+                    self.refreshTransitions(history)
+                else:
+                    self.refreshTransitions2(history)
+
+            # new words and emissions change which tags each word can take
+            if self.dirtyTags:
+                self.model.update(buildCandidates(emitting(self.logE[:len(self.vocab)])))
+                self.model.pop("candidates", None)
+
+        instrument.count("online.tagsRefreshed", len(self.dirtyTags))
+        instrument.count("online.historiesRefreshed", len(self.dirtyHistories))
+        self.dirtyTags = set()
+        self.dirtyHistories = set()
+
+        self.version += 1
+        self.model["emissions"] = self.logE[:len(self.vocab)]
+        self.published = dict(self.model, vocab=self.vocab.copy(),
+                              meta=dict(self.model.get("meta", {}), version=self.version))
+        return self.published
+
+    def refreshEmissions(self, tag):
+        """
+        Recomputes the log emissions of one tag, as estEmissions
+        and buildEmissionTable would
+        """
+        t = self.vocab.tagId(tag)
+        column = self.logE[:, t]
+        column[:] = -np.inf
+
+        denominator = float(self.counts["tags"][tag] + self.k)
+        for x, xCount in self.counts["emissions"][tag].items():
+            p = xCount / denominator
+            if p != 0:
+                column[self.vocab.wordId(x)] = log(p)
+
+        p = self.k / denominator
+        if p != 0:
+            column[UNK_ID] = log(p)
+
+    def refreshTransitions(self, prev):
+        """
+        Recomputes the first order log transitions out of prev, as
+        estTransitions and buildTables would
+        """
+        tables = self.model
+        if prev == START:
+            tables["start"][:] = -np.inf
+        else:
+            r = self.vocab.tagId(prev)
+            tables["transitions"][r] = -np.inf
+            tables["stop"][r] = -np.inf
+
+        history = float(self.counts["histories"].get(prev, 0))
+        for curr, currCount in self.counts["transitions"][prev].items():
+            if history == 0:
+                break
+            p = currCount / history
+            if p == 0:
+                continue
+
+            if prev == START and curr != STOP:
+                tables["start"][self.vocab.tagId(curr)] = log(p)
+            elif prev != START and curr == STOP:
+                tables["stop"][r] = log(p)
+            elif prev != START:
+                tables["transitions"][r, self.vocab.tagId(curr)] = log(p)
+
+    def refreshTransitions2(self, parents):
+        """
+        Recomputes the second order log transitions out of the
+        (y_jm2, y_jm1) pair parents, as estTransitions2 and buildTables2 would
+        """
+        tables = self.model
+        l, m = (self.vocab.tagId(y) for y in parents)
+        tables["transitions"][l, m] = -np.inf
+        tables["stop"][l, m] = -np.inf
+
+        history = float(self.counts["histories2"][parents])
+        for y_j, currCount in self.counts["transitions2"].get(parents, {}).items():
+            p = currCount / history
+            if p == 0:
+                continue
+
+            if y_j == STOP:
+                tables["stop"][l, m] = log(p)
+            else:
+                tables["transitions"][l, m, self.vocab.tagId(y_j)] = log(p)
+
+    def snapshot(self, file):
+        """
+        Saves the current tables with saveModel, together with the raw
+        counts so that fromModel can carry on from them. The file can be
+        used by tagger.py and server.py like any other model
+        """
+        model = dict(self.tables())
+        model.update(countsToArrays(self.counts, self.vocab))
+        model["meta"] = {"online": True, "k": self.k}
+        saveModel(file, model)
+
+
+def countsToArrays(counts, vocab):
+    """
+    Packs the counts of countLines into arrays indexed by vocab ids.
+    Tag id K stands for _START in history axes and _STOP in child axes
+
+    @return Dict: {"emissionCounts": (V, K), "transitionCounts": (K+1, K+1),
+                   "historyCounts": (K+1,), "transition2Counts": (K+1, K+1, K+1),
+                   "history2Counts": (K+1, K+1)}
+    """
+    K = len(vocab.tags)
+    emissionCounts = np.zeros((len(vocab), K), dtype=np.int64)
+    transitionCounts = np.zeros((K + 1, K + 1), dtype=np.int64)
+    historyCounts = np.zeros(K + 1, dtype=np.int64)
+    transition2Counts = np.zeros((K + 1, K + 1, K + 1), dtype=np.int64)
+    history2Counts = np.zeros((K + 1, K + 1), dtype=np.int64)
+
+    for y, xDict in counts["emissions"].items():
+        for x, count in xDict.items():
+            emissionCounts[vocab.wordId(x), vocab.tagId(y)] = count
+    for prev, currDict in counts["transitions"].items():
+        for curr, count in currDict.items():
+            transitionCounts[vocab.tagId(prev), vocab.tagId(curr)] = count
+    for y, count in counts["histories"].items():
+        historyCounts[vocab.tagId(y)] = count
+    for (y_jm2, y_jm1), children in counts["transitions2"].items():
+        for y_j, count in children.items():
+            transition2Counts[vocab.tagId(y_jm2), vocab.tagId(y_jm1), vocab.tagId(y_j)] = count
+    for (y_jm2, y_jm1), count in counts["histories2"].items():
+        history2Counts[vocab.tagId(y_jm2), vocab.tagId(y_jm1)] = count
+
+    return {
+        "emissionCounts": emissionCounts,
+        "transitionCounts": transitionCounts,
+        "historyCounts": historyCounts,
+        "transition2Counts": transition2Counts,
+        "history2Counts": history2Counts,
+    }
+
+
+def arraysToCounts(model):
+    """
+    Unpacks the arrays of countsToArrays back into countLines format,
+    with tags in vocabulary order
+
+    @param model: output from loadModel function
+    @return Dict: output from countLines function
+    """
+    vocab = model["vocab"]
+    words = vocab.words
+    K = len(vocab.tags)
+    names = vocab.tags + [START]
+    children = vocab.tags + [STOP]
+
+    emissionCounts = np.asarray(model["emissionCounts"])
+    counts = countLines([])
+    for t, y in enumerate(vocab.tags):
+        column = emissionCounts[:, t]
+        rows = np.flatnonzero(column)
+        counts["emissions"][y] = {words[i]: int(column[i]) for i in rows}
+        counts["tags"][y] = int(column.sum())
+
+    transitionCounts = np.asarray(model["transitionCounts"])
+    for r in range(K + 1):
+        row = transitionCounts[r]
+        if row.any():
+            counts["transitions"][names[r]] = {children[c]: int(row[c]) for c in np.flatnonzero(row)}
+    counts["histories"] = {names[r]: int(count) for r, count in enumerate(model["historyCounts"])
+                           if count or r == K}
+
+    transition2Counts = np.asarray(model["transition2Counts"])
+    for l, m in zip(*np.nonzero(transition2Counts.any(axis=2))):
+        row = transition2Counts[l, m]
+        counts["transitions2"][names[l], names[m]] = {children[c]: int(row[c])
+                                                      for c in np.flatnonzero(row)}
+    history2Counts = np.asarray(model["history2Counts"])
+    for l, m in zip(*np.nonzero(history2Counts)):
+        counts["histories2"][names[l], names[m]] = int(history2Counts[l, m])
+    counts["histories2"].setdefault((START, START), 0)
+
+    counts["words"] = set(words) - {UNK}
+    return counts
+
+
+# main
+# python onlineModel.py [first/second] [model file] [labelled file ...]
+# adds labelled sentences to the model, creating it if it does not exist
+if __name__ == "__main__":
+    instrument.fromEnvironment()
+    if len(sys.argv) < 4 or sys.argv[1] not in ("first", "second"):
+        print("Usage: python onlineModel.py [first/second] [model file] [labelled file ...]")
+        sys.exit()
+
+    kind, modelPath = sys.argv[1], Path(sys.argv[2])
+    if modelPath.exists():
+        online = OnlineModel.fromModel(loadModel(modelPath))
+        if online.kind != kind:
+            print("{} is a {} order model".format(modelPath, online.kind))
+            sys.exit(1)
+    else:
+        online = OnlineModel(kind)
+
+    for labelledFile in sys.argv[3:]:
+        with open(labelledFile, encoding="utf-8") as f:
+            print("Added {} words from {}".format(online.addLines(f), labelledFile))
+
+    online.snapshot(modelPath)
+    print("Output:", modelPath)
+    print("Done!")
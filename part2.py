@@ -1,8 +1,12 @@
 from pathlib import Path
+import numpy as np
 from sharedFunctions import estEmissions
+from modelFile import saveModel, loadModel, isFresh
+from vocabulary import Vocabulary, UNK
+import instrument
 
 
-def predictSentiments(emissions, testfile, outputfile="dev.p2.out"):
+def predictSentiments(emissions, testfile, outputfile="dev.p2.out", table=None):
     """
     Predicts sentiments using argmax(emission)
     If no outputfile given, saves labelled file as dev.p2.out
@@ -10,47 +14,131 @@ def predictSentiments(emissions, testfile, outputfile="dev.p2.out"):
     @param emissions: output from estEmissions function
     @param testfile: input file with unlabelled text
     @param outputfile: name of file to save the output of labelled text
+    @param table: output from buildArgmaxTable or loadModel function.
+    If given, emissions are not used
+    """
+    if table is None:
+        table = buildArgmaxTable(emissions)
+
+    with open(testfile) as f, open(outputfile, "w") as out:
+        predictTableStream(table, f, out)
+
+
+def buildArgmaxTable(emissions):
+    """
+    Finds the most likely tag of every word once, so that tagging
+    a word is a single lookup. The tag for unknown words is stored
+    in the row of #UNK#
+
+    @param emissions: output from estEmissions function
+
+    @return Dict: {"kind": "argmax", "vocab": Vocabulary,
+                   "best": (V,) array of tag ids}
     """
     # find best #UNK# for later use
+    # unkP is never raised, so this is the last tag that has #UNK#
     unkTag = "O"
     unkP = 0
     for tag in emissions.keys():
         if emissions[tag]["#UNK#"] > unkP:
             unkTag = tag
 
-    with open(testfile) as f, open(outputfile, "w") as out:
-        for line in f:
+    # find most likely tag for each word, the first tag wins ties
+    bestP = {}
+    bestTag = {}
+    for tag, xDict in emissions.items():
+        for word, p in xDict.items():
+            if word != UNK and p > bestP.get(word, 0):
+                bestP[word] = p
+                bestTag[word] = tag
+
+    vocab = Vocabulary(bestTag.keys(), emissions.keys())
+    vocab.addTag(unkTag)
+
+    best = np.empty(len(vocab), dtype=np.int32)
+    best[vocab.wordId(UNK)] = vocab.tagId(unkTag)
+    for word, tag in bestTag.items():
+        best[vocab.wordId(word)] = vocab.tagId(tag)
+
+    return {
+        "kind": "argmax",
+        "vocab": vocab,
+        "best": best,
+    }
+
+
+def getLookup(table):
+    """
+    Returns {word: tag} for a table from buildArgmaxTable or loadModel,
+    with #UNK# mapped to the tag for unknown words. It is built on first
+    use and kept in table
+    """
+    if "lookup" not in table:
+        vocab = table["vocab"]
+        table["lookup"] = dict(zip(vocab.words, vocab.decode(table["best"].tolist())))
+
+    return table["lookup"]
+
+
+def predictTableList(table, textList):
+    """
+    Predicts tags for a list of words with an argmax table
+
+    @param table: output from buildArgmaxTable or loadModel function
+    @param textList: list of words
+    @return: list of predicted tags
+    """
+    lookup = getLookup(table)
+    unkTag = lookup[UNK]
+
+    return [lookup.get(word.lower(), unkTag) for word in textList]
+
+
+def predictTableStream(table, lines, out):
+    """
+    Tags lines of unlabelled text with an argmax table, writing
+    to any file-like object
+
+    @param table: output from buildArgmaxTable or loadModel function
+    @param lines: iterable of lines of unlabelled text
+    @param out: file-like object to write labelled text to
+    """
+    lookup = getLookup(table)
+    unkTag = lookup[UNK]
+    if instrument.enabled:
+        lines = instrument.countWords(lines, "part2", lookup)
+
+    with instrument.timer("part2.tag"):
+        for line in lines:
             if line == "\n":
                 out.write(line)
             else:
                 word = line.strip().lower()
-
-                # find most likely tag for word
-                bestP = 0
-                bestTag = ""
-                for tag in emissions.keys():
-                    if word in emissions[tag]:
-                        if emissions[tag][word] > bestP:
-                            bestP = emissions[tag][word]
-                            bestTag = tag
-
-                if bestTag == "":
-                    bestTag = unkTag
-
-                out.write("{} {}\n".format(word, bestTag))
+                out.write("{} {}\n".format(word, lookup.get(word, unkTag)))
 
 
 # main
-datasets = ["EN", "FR", "CN", "SG"]
-for ds in datasets:
-    datafolder = Path(ds)
-    trainFile = datafolder / "train"
-    testFile = datafolder / "dev.in"
-    outputFile = datafolder / "dev.p2.out"
+if __name__ == "__main__":
+    instrument.fromEnvironment()
+    datasets = ["EN", "FR", "CN", "SG"]
+    for ds in datasets:
+        datafolder = Path(ds)
+        trainFile = datafolder / "train"
+        testFile = datafolder / "dev.in"
+        outputFile = datafolder / "dev.p2.out"
+        modelPath = datafolder / "model.p2"
+
+        # reuse the saved table unless train has changed since
+        if isFresh(modelPath, trainFile):
+            table = loadModel(modelPath)
+        else:
+            emissions = estEmissions(trainFile)
+            with instrument.timer("part2.build"):
+                table = buildArgmaxTable(emissions)
+            saveModel(modelPath, table)
 
-    emissions = estEmissions(trainFile)
-    predictSentiments(emissions, testFile, outputFile)
+        predictSentiments(None, testFile, outputFile, table)
 
-    print("Output:", outputFile)
+        print("Output:", outputFile)
 
-print("Done!")
+    print("Done!")
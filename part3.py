@@ -1,9 +1,20 @@
 from pathlib import Path
 from math import log
-from sharedFunctions import estEmissions, estTransitions, getDictionary
+from time import perf_counter
+import sys
+import numpy as np
+from sharedFunctions import countCorpus, estEmissions, estTransitions, getDictionary, buildTables, countStates,\
+    logTable, logRows, getCandidates
+from modelFile import saveModel, loadModel, isFresh
+from vocabulary import UNK_ID
+import instrument
 
+# number of batches predictViterbiFile reads before sorting by length
+BATCH_WINDOW = 16
 
-def predictViterbiFile(emissions, transitions, dictionary, inputFile, outputFile):
+
+def predictViterbiFile(emissions, transitions, dictionary, inputFile, outputFile, tables=None,
+                       batchSize=None):
     """
     Predicts sentiments using the Viterbi algorithm
     If not outputFile given, saves labelled file as dev.p3.out
@@ -13,23 +24,94 @@ def predictViterbiFile(emissions, transitions, dictionary, inputFile, outputFile
     @param dictionary: output from getDictionary function
     @param inputFile: name of file with unlabelled text
     @param outputFile: name of file to save output of unlabelled text to
+    @param tables: output from buildTables or loadModel function. If given,
+    sentences are decoded with predictViterbiArray instead of
+    predictViterbiList and the other models may be None
+    @param batchSize: if given with tables, sentences are decoded
+    with predictViterbiBatch in batches of this many sentences
+
+    @return: number of words tagged
     """
     with open(inputFile) as f, open(outputFile, "w") as out:
-        sentence = []
+        return predictViterbiStream(emissions, transitions, dictionary, f, out, tables, batchSize)
 
-        for line in f:
-            # form sentence
-            if line != "\n":
-                word = line.strip()
-                sentence.append(word)
 
-            # predict tag sequence
-            else:
-                sequence = predictViterbiList(emissions, transitions, dictionary, sentence)
-                for i in range(len(sequence)):
-                    out.write("{} {}\n".format(sentence[i], sequence[i]))
-                out.write("\n")
-                sentence = []
+def predictViterbiStream(emissions, transitions, dictionary, lines, out, tables=None,
+                         batchSize=None):
+    """
+    Same as predictViterbiFile but reads lines from any iterable and
+    writes to any file-like object, so it can tag part of a file
+
+    @param lines: iterable of lines of unlabelled text
+    @param out: file-like object to write labelled text to
+
+    @return: number of words tagged
+    """
+    count = 0
+    sentenceCount = 0
+    sentence = []
+    sentences = []
+
+    for line in lines:
+        # form sentence
+        if line != "\n":
+            word = line.strip()
+            sentence.append(word)
+
+        # predict tag sequences a window of batches at a time
+        elif batchSize is not None:
+            sentences.append(sentence)
+            count += len(sentence)
+            sentenceCount += 1
+            sentence = []
+            if len(sentences) == batchSize * BATCH_WINDOW:
+                writeBatch(out, tables, sentences, batchSize)
+                sentences = []
+
+        # predict tag sequence
+        else:
+            with instrument.timer("part3.sentence"):
+                if tables is None:
+                    sequence = predictViterbiList(emissions, transitions, dictionary, sentence)
+                else:
+                    sequence = predictViterbiArray(tables, sentence)
+            with instrument.timer("part3.write"):
+                writeSentences(out, [sentence], [sequence])
+            count += len(sentence)
+            sentenceCount += 1
+            sentence = []
+
+    if sentences:
+        writeBatch(out, tables, sentences, batchSize)
+
+    instrument.count("part3.tokens", count)
+    instrument.count("part3.sentences", sentenceCount)
+    return count
+
+
+def writeBatch(out, tables, sentences, batchSize):
+    """
+    Decodes sentences with predictViterbiBatch and writes them
+    """
+    with instrument.timer("part3.batch"):
+        sequences = predictViterbiBatch(tables, sentences, batchSize)
+    with instrument.timer("part3.write"):
+        writeSentences(out, sentences, sequences)
+
+
+def writeSentences(out, sentences, sequences):
+    """
+    Writes each word with its predicted tag, and a blank line after
+    each sentence
+
+    @param out: file to write to
+    @param sentences: list of lists of words
+    @param sequences: list of predicted tag sequences, one per sentence
+    """
+    for sentence, sequence in zip(sentences, sequences):
+        for i in range(len(sequence)):
+            out.write("{} {}\n".format(sentence[i], sequence[i]))
+        out.write("\n")
 
 
 def isMissing(child, parent, d):
@@ -57,6 +139,9 @@ def predictViterbiList(emissions, transitions, dictionary, textList):
     tags = emissions.keys()
     pies = {}
     pies[0] = {"_START": [0.0, None]}
+    unknown = 0
+    expanded = 0
+    skipped = 0
 
     # forward iterations
     # Calculate log pie to combat underflow problem
@@ -66,6 +151,7 @@ def predictViterbiList(emissions, transitions, dictionary, textList):
         # Replace word with #UNK# if not in train
         if word not in dictionary:
             word = "#UNK#"
+            unknown += 1
 
         for currTag in tags:
             bestPie = None
@@ -73,9 +159,11 @@ def predictViterbiList(emissions, transitions, dictionary, textList):
 
             # Check that word can be emitted from currTag
             if isMissing(word, currTag, emissions):
+                skipped += 1
                 continue
 
             b = emissions[currTag][word]
+            expanded += 1
 
             for prevTag, prevPie in pies[i - 1].items():
 
@@ -117,6 +205,10 @@ def predictViterbiList(emissions, transitions, dictionary, textList):
 
     pies[len(textList) + 1] = {"_STOP": [bestPie, parent]}
 
+    instrument.count("part3.unk", unknown)
+    instrument.count("part3.statesExpanded", expanded)
+    instrument.count("part3.statesSkipped", skipped)
+
     # backtracking to get sequence
     sequence = []
     curr = "_STOP"
@@ -138,19 +230,244 @@ def predictViterbiList(emissions, transitions, dictionary, textList):
     return sequence
 
 
-# main
-datasets = ["EN", "FR", "CN", "SG"]
-for ds in datasets:
-    datafolder = Path(ds)
-    trainFile = datafolder / "train"
-    testFile = datafolder / "dev.in"
-    outputFile = datafolder / "dev.p3.out"
+def predictViterbiArray(tables, textList, candidates=False):
+    """
+    Predicts sentiments for a list of words using the
+    Viterbi algorithm on tag indexed log probability arrays.
+    Gives the same sequence as predictViterbiList, including
+    its fallbacks when no path survives
+
+    @param tables: output from buildTables function
+    @param textList: list of words
+    @param candidates: if True, only the tags each word can take are
+    searched, with decodeCandidates. The sequence is the same; with
+    first order tables the full search is usually as fast
 
-    emissions = estEmissions(trainFile)
-    transitions = estTransitions(trainFile)
-    dictionary = getDictionary(trainFile)
-    predictViterbiFile(emissions, transitions, dictionary, testFile, outputFile)
+    @return: most probable y sequence for given textList as a list
+    """
+    if len(textList) == 0:
+        return []
+
+    vocab = tables["vocab"]
+    logA = logTable(tables, "transitions")
+
+    # Replace word with #UNK# if not in train
+    with instrument.timer("part3.normalize"):
+        ids = vocab.encode(textList)
+    emit = logRows(tables, "emissions", ids)
+    if instrument.enabled:
+        countStates("part3", ids, emit)
+    if candidates:
+        sequence = decodeCandidates(tables, ids, emit)
+        if sequence is not None:
+            return vocab.decode(sequence)
+
+    parents = np.empty((len(textList), len(vocab.tags)), dtype=np.intp)
+    pies = np.empty((len(textList), len(vocab.tags)), dtype=emit.dtype)
+
+    # forward iterations, one (prev, curr) matrix per word
+    pies[0] = logTable(tables, "start") + emit[0]
+    for i in range(1, len(textList)):
+        scores = pies[i - 1][:, None] + logA
+        scores += emit[i]
+        parents[i] = scores.argmax(axis=0)
+        pies[i] = scores.max(axis=0)
+
+    # stop case
+    scores = pies[-1] + logTable(tables, "stop")
+    curr = int(scores.argmax())
+    if np.isneginf(scores[curr]):
+        curr = firstEmitting(emit[-1])
+
+    # backtracking to get sequence
+    # a -inf pie means no path survived, so parents[i] is meaningless
+    survived = np.isfinite(pies).tolist()
+    parents = parents.tolist()
+    sequence = [curr]
+    for i in range(len(textList) - 1, 0, -1):
+        if survived[i][curr]:
+            curr = parents[i][curr]
+        else:
+            curr = firstEmitting(emit[i - 1])
+        sequence.append(curr)
+    sequence.reverse()
+
+    return vocab.decode(sequence)
+
+
+def decodeCandidates(tables, ids, emit):
+    """
+    Runs predictViterbiArray over the candidate tags of each word
+    only, keeping tag order so ties and fallbacks pick the same tags
 
-    print("Output:", outputFile)
+    @param tables: output from buildTables function
+    @param ids: word ids of a non-empty sentence
+    @param emit: log emission rows of the same words
 
-print("Done!")
+    @return: list of tag ids, or None if a word has no candidate tag
+    """
+    index = getCandidates(tables)
+    tagLists = [index[x] for x in ids]
+    if not all(len(tagList) for tagList in tagLists):
+        return None
+    logA = logTable(tables, "transitions")
+
+    # pies, parents and survived are indexed by position in tagLists[i]
+    prev = tagLists[0]
+    pie = logTable(tables, "start")[prev] + emit[0, prev]
+    parents = [None]
+    survived = [None]
+    for i in range(1, len(ids)):
+        curr = tagLists[i]
+        scores = pie[:, None] + logA[prev[:, None], curr]
+        scores += emit[i, curr]
+        parents.append(scores.argmax(axis=0).tolist())
+        pie = scores.max(axis=0)
+        survived.append(np.isfinite(pie).tolist())
+        prev = curr
+
+    # stop case, the first candidate is the first emitting tag
+    scores = pie + logTable(tables, "stop")[prev]
+    position = int(scores.argmax())
+    if np.isneginf(scores[position]):
+        position = 0
+
+    sequence = [int(prev[position])]
+    for i in range(len(ids) - 1, 0, -1):
+        position = parents[i][position] if survived[i][position] else 0
+        sequence.append(int(tagLists[i - 1][position]))
+    sequence.reverse()
+
+    return sequence
+
+
+def firstEmitting(emit):
+    """
+    Returns the first tag id that can emit a word, which is the
+    tag predictViterbiList falls back on when no path survives
+
+    @param emit: row of log emissions for the word
+    """
+    return int(np.isfinite(emit).argmax())
+
+
+def predictViterbiBatch(tables, sentences, batchSize=128):
+    """
+    Predicts sentiments for many lists of words at once. Sentences are
+    sorted by length and cut into batches, each batch is padded to its
+    longest sentence and decoded together, with finished sentences
+    carrying their pies forward unchanged
+
+    @param tables: output from buildTables function
+    @param sentences: list of lists of words
+    @param batchSize: number of sentences decoded together
+
+    @return: list of the sequences predictViterbiArray would give,
+    in the same order as sentences
+    """
+    sequences = [[] for _ in sentences]
+    order = sorted(range(len(sentences)), key=lambda j: len(sentences[j]))
+    order = [j for j in order if len(sentences[j]) > 0]
+
+    for b in range(0, len(order), batchSize):
+        batch = order[b:b + batchSize]
+        for j, sequence in zip(batch, decodeBatch(tables, [sentences[j] for j in batch])):
+            sequences[j] = sequence
+
+    return sequences
+
+
+def decodeBatch(tables, sentences):
+    """
+    Runs predictViterbiArray over a batch of non-empty sentences
+    as padded arrays
+
+    @param tables: output from buildTables function
+    @param sentences: list of lists of words
+
+    @return: list of predicted sequences
+    """
+    vocab = tables["vocab"]
+    logA = logTable(tables, "transitions")
+    lengths = np.array([len(sentence) for sentence in sentences])
+    B, L, K = len(sentences), lengths.max(), len(vocab.tags)
+
+    # Replace word with #UNK# if not in train, padding is #UNK# too
+    with instrument.timer("part3.normalize"):
+        ids = np.full((B, L), UNK_ID)
+        for b, sentence in enumerate(sentences):
+            ids[b, :len(sentence)] = vocab.encode(sentence)
+    emit = logRows(tables, "emissions", ids)
+    if instrument.enabled:
+        for b in range(B):
+            countStates("part3", ids[b, :lengths[b]], emit[b, :lengths[b]])
+    parents = np.empty((L, B, K), dtype=np.intp)
+    survived = np.empty((L, B, K), dtype=bool)
+
+    # forward iterations, one (prev, curr) matrix per sentence and word
+    pie = logTable(tables, "start") + emit[:, 0]
+    survived[0] = np.isfinite(pie)
+    for i in range(1, L):
+        scores = pie[:, :, None] + logA
+        scores += emit[:, i, None, :]
+        parents[i] = scores.argmax(axis=1)
+        active = (lengths > i)[:, None]
+        pie = np.where(active, scores.max(axis=1), pie)
+        survived[i] = np.isfinite(pie)
+
+    # stop case
+    rows = np.arange(B)
+    fallback = np.isfinite(emit).argmax(axis=2)
+    scores = pie + logTable(tables, "stop")
+    curr = scores.argmax(axis=1)
+    curr = np.where(np.isfinite(scores[rows, curr]), curr, fallback[rows, lengths - 1])
+
+    # backtracking to get sequences, all sentences at once
+    # a -inf pie means no path survived, so parents[i] is meaningless
+    path = np.empty((B, L), dtype=np.intp)
+    path[rows, lengths - 1] = curr
+    for i in range(L - 1, 0, -1):
+        prev = np.where(survived[i, rows, curr], parents[i, rows, curr], fallback[:, i - 1])
+        curr = np.where(lengths > i, prev, curr)
+        path[:, i - 1] = curr
+
+    return [vocab.decode(path[b, :lengths[b]].tolist()) for b in range(B)]
+
+
+# main
+# python part3.py [batchSize] also compares batch and per sentence speed
+if __name__ == "__main__":
+    instrument.fromEnvironment()
+    batchSize = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    datasets = ["EN", "FR", "CN", "SG"]
+    for ds in datasets:
+        datafolder = Path(ds)
+        trainFile = datafolder / "train"
+        testFile = datafolder / "dev.in"
+        outputFile = datafolder / "dev.p3.out"
+        modelPath = datafolder / "model.p3"
+
+        # reuse the saved model unless train has changed since
+        if isFresh(modelPath, trainFile):
+            tables = loadModel(modelPath)
+        else:
+            counts = countCorpus(trainFile)
+            emissions = estEmissions(trainFile, counts=counts)
+            transitions = estTransitions(trainFile, counts=counts)
+            dictionary = getDictionary(trainFile, counts=counts)
+            tables = buildTables(emissions, transitions, dictionary)
+            saveModel(modelPath, tables)
+
+        start = perf_counter()
+        count = predictViterbiFile(None, None, None, testFile, outputFile, tables)
+        elapsed = perf_counter() - start
+
+        print("Output:", outputFile)
+        if batchSize is not None:
+            start = perf_counter()
+            predictViterbiFile(None, None, None, testFile, outputFile, tables, batchSize)
+            batchElapsed = perf_counter() - start
+            print("{:.0f} tokens/sec per sentence, {:.0f} tokens/sec in batches of {}".format(
+                count / elapsed, count / batchElapsed, batchSize))
+
+    print("Done!")
@@ -1,10 +1,29 @@
 # -*- coding: utf-8 -*-
 from pathlib import Path
-from math import log
-from sharedFunctions import estEmissions, estTransitions2, getDictionary
-
-
-def predictViterbiFile(emissions, transitions, dictionary, inputFile, outputFile):
+from math import log, inf
+from time import perf_counter
+import heapq
+import sys
+import numpy as np
+from sharedFunctions import countCorpus, estEmissions, estTransitions2, getDictionary, buildTables2,\
+    countStates, logTable, logRows, getCandidates
+from modelFile import saveModel, loadModel, isFresh
+from vocabulary import UNK_ID
+import instrument
+
+# number of batches predictViterbiFile reads before sorting by length
+BATCH_WINDOW = 16
+
+# with at least this many tags, searching only each word's candidate
+# tags is faster than the full (l, m, n) tensor, even in batches
+CANDIDATE_TAGS = 12
+
+# score of a tag pair decodeBeam has not reached yet
+NO_STATE = (-inf, None)
+
+
+def predictViterbiFile(emissions, transitions, dictionary, inputFile, outputFile, tables=None,
+                       batchSize=None, beam=None):
     """
     Predicts sentiments using the Viterbi algorithm
     If not outputFile given, saves labelled file as dev.p3.out
@@ -14,23 +33,97 @@ def predictViterbiFile(emissions, transitions, dictionary, inputFile, outputFile
     @param dictionary: output from getDictionary function
     @param inputFile: name of file with unlabelled text
     @param outputFile: name of file to save output of unlabelled text to
+    @param tables: output from buildTables2 or loadModel function. If given,
+    sentences are decoded with predictViterbiArray instead of
+    predictViterbiList and the other models may be None
+    @param batchSize: if given with tables, sentences are decoded
+    with predictViterbiBatch in batches of this many sentences
+    @param beam: if given with tables, sentences are decoded one at a
+    time by predictViterbiArray with this beam width
+
+    @return: number of words tagged
     """
     with open(inputFile, encoding="utf-8") as f, open(outputFile, "w", encoding="utf-8") as out:
-        sentence = []
+        return predictViterbiStream(emissions, transitions, dictionary, f, out, tables, batchSize,
+                                    beam)
+
+
+def predictViterbiStream(emissions, transitions, dictionary, lines, out, tables=None,
+                         batchSize=None, beam=None):
+    """
+    Same as predictViterbiFile but reads lines from any iterable and
+    writes to any file-like object, so it can tag part of a file
+
+    @param lines: iterable of lines of unlabelled text
+    @param out: file-like object to write labelled text to
+
+    @return: number of words tagged
+    """
+    count = 0
+    sentenceCount = 0
+    sentence = []
+    sentences = []
+
+    for line in lines:
+        # form sentence
+        if line != "\n":
+            word = line.strip()
+            sentence.append(word)
+
+        # predict tag sequences a window of batches at a time
+        elif batchSize is not None and beam is None:
+            sentences.append(sentence)
+            count += len(sentence)
+            sentenceCount += 1
+            sentence = []
+            if len(sentences) == batchSize * BATCH_WINDOW:
+                writeBatch(out, tables, sentences, batchSize)
+                sentences = []
+
+        # predict tag sequence
+        else:
+            with instrument.timer("part4.sentence"):
+                if tables is None:
+                    sequence = predictViterbiList(emissions, transitions, dictionary, sentence)
+                else:
+                    sequence = predictViterbiArray(tables, sentence, beam)
+            with instrument.timer("part4.write"):
+                writeSentences(out, [sentence], [sequence])
+            count += len(sentence)
+            sentenceCount += 1
+            sentence = []
+
+    if sentences:
+        writeBatch(out, tables, sentences, batchSize)
+
+    instrument.count("part4.tokens", count)
+    instrument.count("part4.sentences", sentenceCount)
+    return count
+
 
-        for line in f:
-            # form sentence
-            if line != "\n":
-                word = line.strip()
-                sentence.append(word)
+def writeBatch(out, tables, sentences, batchSize):
+    """
+    Decodes sentences with predictViterbiBatch and writes them
+    """
+    with instrument.timer("part4.batch"):
+        sequences = predictViterbiBatch(tables, sentences, batchSize)
+    with instrument.timer("part4.write"):
+        writeSentences(out, sentences, sequences)
 
-            # predict tag sequence
-            else:
-                sequence = predictViterbiList(emissions, transitions, dictionary, sentence)
-                for i in range(len(sequence)):
-                    out.write("{} {}\n".format(sentence[i], sequence[i]))
-                out.write("\n")
-                sentence = []
+
+def writeSentences(out, sentences, sequences):
+    """
+    Writes each word with its predicted tag, and a blank line after
+    each sentence
+
+    @param out: file to write to
+    @param sentences: list of lists of words
+    @param sequences: list of predicted tag sequences, one per sentence
+    """
+    for sentence, sequence in zip(sentences, sequences):
+        for i in range(len(sequence)):
+            out.write("{} {}\n".format(sentence[i], sequence[i]))
+        out.write("\n")
 
 
 def isMissing(child, parent, d):
@@ -64,6 +157,9 @@ def predictViterbiList(emissions, transitions, dictionary, textList):
     # b[i] = {X: {parent: b_i(parent, X)}}
     d[0] = {"_START": {"_None": 0.0}}
     d[1] = {"_START": {"_START": 0.0}}
+    unknown = 0
+    expanded = 0
+    skipped = 0
 
     # forward iterations
     # Calculate log pie to combat underflow problem
@@ -73,12 +169,15 @@ def predictViterbiList(emissions, transitions, dictionary, textList):
         # Replace word with #UNK# if not in train
         if word not in dictionary:
             word = "#UNK#"
+            unknown += 1
         for n in tags:
 
             # Skip if emission is 0
             if isMissing(word, n, emissions):
+                skipped += 1
                 continue
             b = emissions[n][word]
+            expanded += 1
 
             for m in tags:
                 bestPie = None
@@ -114,6 +213,10 @@ def predictViterbiList(emissions, transitions, dictionary, textList):
                 else:
                     c[i] = {(m, n): grandparent}
 
+    instrument.count("part4.unk", unknown)
+    instrument.count("part4.statesExpanded", expanded)
+    instrument.count("part4.statesSkipped", skipped)
+
     # stop case
     bestPie = None
     grandparent = None
@@ -161,19 +264,475 @@ def predictViterbiList(emissions, transitions, dictionary, textList):
     return sequence
 
 
-# main
-datasets = ["EN", "FR", "CN", "SG"]
-for ds in datasets:
-    datafolder = Path(ds)
+def predictViterbiArray(tables, textList, beam=None, candidates=None):
+    """
+    Predicts sentiments for a list of words using the second order
+    Viterbi algorithm on tag indexed log probability arrays.
+    Gives the same sequence as predictViterbiList, including its
+    fallbacks when no path survives, for sentences of two or more
+    words. A single word gets a single tag.
+
+    @param tables: output from buildTables2 function
+    @param textList: list of words
+    @param beam: if given, sentences of two or more words are decoded by
+    decodeBeam, keeping only the best beam (prev, curr) pairs at each
+    word, which is faster but no longer exact. A sentence whose paths
+    all fall out of the beam is decoded exactly
+    @param candidates: if True, only the tags each word can take are
+    searched, with decodeCandidates, giving the same sequence. Defaults
+    to True when there are CANDIDATE_TAGS tags or more
+
+    @return: most probable y sequence for given textList as a list
+    """
+    if len(textList) == 0:
+        return []
+
+    vocab = tables["vocab"]
+    logA = logTable(tables, "transitions")
+    logStop = logTable(tables, "stop")
+    K = len(vocab.tags)
+
+    # Replace word with #UNK# if not in train
+    with instrument.timer("part4.normalize"):
+        ids = vocab.encode(textList)
+    emit = logRows(tables, "emissions", ids)
+    if instrument.enabled:
+        countStates("part4", ids, emit)
+    if beam is not None and len(textList) > 1:
+        sequence = decodeBeam(tables, ids, emit, beam)
+        if sequence is not None:
+            return vocab.decode(sequence)
+    if candidates is None:
+        candidates = K >= CANDIDATE_TAGS
+    if candidates:
+        sequence = decodeCandidates(tables, ids, emit)
+        if sequence is not None:
+            return vocab.decode(sequence)
+
+    # base case, history is (_START, _START)
+    first = logA[K, K] + emit[0]
+    if len(textList) == 1:
+        scores = first + logStop[K, :K]
+        curr = int(scores.argmax())
+        if np.isneginf(scores[curr]):
+            curr = firstEmitting(emit[0])
+        return vocab.decode([curr])
+
+    # pies[i][m, n] is the best score with tag m at i - 1 and tag n at i
+    # parents[i][m, n] is the tag at i - 2 on that path
+    pies = np.empty((len(textList), K, K), dtype=emit.dtype)
+    parents = np.empty((len(textList), K, K), dtype=np.intp)
+    pies[1] = first[:, None] + logA[K, :K]
+    pies[1] += emit[1]
+
+    # forward iterations, one (l, m, n) tensor per word
+    for i in range(2, len(textList)):
+        scores = pies[i - 1][:, :, None] + logA[:K, :K]
+        scores += emit[i]
+        parents[i] = scores.argmax(axis=0)
+        pies[i] = scores.max(axis=0)
+
+    # stop case, ties go to the first (n, m) like predictViterbiList
+    scores = (pies[-1] + logStop[:K, :K]).T
+    best = int(scores.argmax())
+    if np.isneginf(scores.flat[best]):
+        parent = firstEmitting(emit[-1])
+        grandparent = 0
+    else:
+        parent, grandparent = divmod(best, K)
+
+    # backtracking to get sequence
+    # a -inf pie means no path survived, so parents[i] is meaningless
+    survived = np.isfinite(pies).tolist()
+    parents = parents.tolist()
+    sequence = [parent, grandparent]
+    for i in range(len(textList) - 1, 1, -1):
+        if survived[i][grandparent][parent]:
+            l = parents[i][grandparent][parent]
+        else:
+            l = firstEmitting(emit[i - 2])
+
+        sequence.append(l)
+        parent = grandparent
+        grandparent = l
+    sequence.reverse()
+
+    return vocab.decode(sequence)
+
+
+def decodeCandidates(tables, ids, emit):
+    """
+    Runs predictViterbiArray over the candidate tags of each word only,
+    so each word costs the product of three short candidate lists
+    instead of K cubed. Tag order is kept, so ties and fallbacks
+    pick the same tags
+
+    @param tables: output from buildTables2 function
+    @param ids: word ids of a non-empty sentence
+    @param emit: log emission rows of the same words
+
+    @return: list of tag ids, or None if a word has no candidate tag
+    """
+    index = getCandidates(tables)
+    tagLists = [index[x] for x in ids]
+    if not all(len(tagList) for tagList in tagLists):
+        return None
+    logA = logTable(tables, "transitions")
+    logStop = logTable(tables, "stop")
+    K = len(tables["vocab"].tags)
+
+    # base case, history is (_START, _START)
+    tags0 = tagLists[0]
+    first = logA[K, K, tags0] + emit[0, tags0]
+    if len(ids) == 1:
+        scores = first + logStop[K, tags0]
+        position = int(scores.argmax())
+        if np.isneginf(scores[position]):
+            position = 0
+        return [int(tags0[position])]
+
+    # pies[i][m, n] and parents[i][m, n] are indexed by positions
+    # in tagLists[i - 1] and tagLists[i], parents holding positions in tagLists[i - 2]
+    tags1 = tagLists[1]
+    pie = first[:, None] + logA[K, tags0[:, None], tags1]
+    pie += emit[1, tags1]
+    pies = [None, pie]
+    parents = [None, None]
+    for i in range(2, len(ids)):
+        l, m, n = tagLists[i - 2], tagLists[i - 1], tagLists[i]
+        scores = pie[:, :, None] + logA[l[:, None, None], m[None, :, None], n]
+        scores += emit[i, n]
+        parents.append(scores.argmax(axis=0))
+        pie = scores.max(axis=0)
+        pies.append(pie)
+
+    # stop case, ties go to the first (n, m) like predictViterbiList
+    m, n = tagLists[-2], tagLists[-1]
+    scores = (pie + logStop[m[:, None], n]).T
+    best = int(scores.argmax())
+    if np.isneginf(scores.flat[best]):
+        parent = int(n[0])
+        grandparent = 0
+    else:
+        parent, grandparent = divmod(best, len(m))
+        parent, grandparent = int(n[parent]), int(m[grandparent])
+
+    # backtracking to get sequence, a tag that is not a candidate
+    # (only the fallback grandparent 0) has no surviving path
+    positions = [dict(zip(tagList.tolist(), range(len(tagList)))) for tagList in tagLists]
+    sequence = [parent, grandparent]
+    for i in range(len(ids) - 1, 1, -1):
+        m = positions[i - 1].get(grandparent)
+        n = positions[i].get(parent)
+        if m is not None and n is not None and np.isfinite(pies[i][m, n]):
+            l = int(tagLists[i - 2][parents[i][m, n]])
+        else:
+            l = int(tagLists[i - 2][0])
+
+        sequence.append(l)
+        parent = grandparent
+        grandparent = l
+    sequence.reverse()
+
+    return sequence
+
+
+def decodeBeam(tables, ids, emit, beam):
+    """
+    Runs predictViterbiArray keeping only the best beam (prev, curr) tag
+    pairs at each word, each extended by the candidate tags of the next
+    word only. A pair reached from several kept pairs keeps the best
+    path, as in exact Viterbi. The few live pairs are scored in plain
+    Python on list copies of the tables, which is cheaper than numpy
+    calls on arrays this small, so each word costs about beam times its
+    number of candidates
+
+    @param tables: output from buildTables2 function
+    @param ids: word ids of a sentence of two or more words
+    @param emit: log emission rows of the same words
+    @param beam: number of tag pairs kept at each word
+
+    @return: list of tag ids, or None if no path survives the beam
+    """
+    index = getCandidates(tables)
+    logA, logStop = logLists(tables)
+    K = len(tables["vocab"].tags)
+    emit = emit.tolist()
+
+    # words without candidate tags, only possible with k = 0, try every tag
+    tagLists = [index[x].tolist() or list(range(K)) for x in ids]
+
+    # base case, history is (_START, _START)
+    start = logA[K][K]
+    states = {}
+    for m in tagLists[0]:
+        first = start[m] + emit[0][m]
+        row = logA[K][m]
+        for n in tagLists[1]:
+            score = first + row[n] + emit[1][n]
+            if score > -inf:
+                states[m, n] = (score, 0)
+
+    # steps[i] holds the live (score, m, n, back) of word i,
+    # back being the position of the (l, m) pair in steps[i - 1]
+    live = prune(states, beam)
+    steps = [None, live]
+    for i in range(2, len(ids)):
+        e = emit[i]
+        tags = tagLists[i]
+        states = {}
+        for back, (score, l, m, _) in enumerate(live):
+            row = logA[l][m]
+            for n in tags:
+                nextScore = score + row[n] + e[n]
+                if nextScore > states.get((m, n), NO_STATE)[0]:
+                    states[m, n] = (nextScore, back)
+        live = prune(states, beam)
+        steps.append(live)
+
+    # stop case
+    best = None
+    bestScore = -inf
+    for position, (score, m, n, _) in enumerate(live):
+        score += logStop[m][n]
+        if score > bestScore:
+            best, bestScore = position, score
+    if best is None:
+        return None
+
+    # backtracking to get sequence
+    _, parent, curr, back = live[best]
+    sequence = [curr, parent]
+    for i in range(len(ids) - 1, 1, -1):
+        _, grandparent, _, back = steps[i - 1][back]
+        sequence.append(grandparent)
+    sequence.reverse()
+
+    return sequence
+
+
+def prune(states, beam):
+    """
+    Returns the best beam of states as a list of (score, m, n, back)
+
+    @param states: {(m, n): (score, back)} of one word
+    """
+    items = states.items()
+    if len(states) > beam:
+        items = heapq.nlargest(beam, items, key=lambda item: item[1][0])
+    return [(score, m, n, back) for (m, n), (score, back) in items]
+
+
+def logLists(tables):
+    """
+    Returns the log transitions and stops as nested lists, made once
+    and kept in tables["logLists"], which saveModel ignores
+    """
+    if "logLists" not in tables:
+        tables["logLists"] = (logTable(tables, "transitions").tolist(), logTable(tables, "stop").tolist())
+    return tables["logLists"]
+
+
+def firstEmitting(emit):
+    """
+    Returns the first tag id that can emit a word, which is the
+    tag predictViterbiList falls back on when no path survives
+
+    @param emit: row of log emissions for the word
+    """
+    return int(np.isfinite(emit).argmax())
+
+
+def predictViterbiBatch(tables, sentences, batchSize=32):
+    """
+    Predicts sentiments for many lists of words at once. Sentences are
+    sorted by length and cut into batches, each batch is padded to its
+    longest sentence and decoded together, with finished sentences
+    carrying their pies forward unchanged
+
+    @param tables: output from buildTables2 function
+    @param sentences: list of lists of words
+    @param batchSize: number of sentences decoded together
+
+    @return: list of the sequences predictViterbiArray would give,
+    in the same order as sentences
+    """
+    # large tag sets are faster searched over candidates one sentence at a time
+    if len(tables["vocab"].tags) >= CANDIDATE_TAGS:
+        return [predictViterbiArray(tables, sentence) for sentence in sentences]
+
+    # single words keep predictViterbiArray's special case
+    sequences = [predictViterbiArray(tables, sentence) if len(sentence) < 2 else None
+                 for sentence in sentences]
+    order = sorted(range(len(sentences)), key=lambda j: len(sentences[j]))
+    order = [j for j in order if len(sentences[j]) > 1]
+
+    for b in range(0, len(order), batchSize):
+        batch = order[b:b + batchSize]
+        for j, sequence in zip(batch, decodeBatch(tables, [sentences[j] for j in batch])):
+            sequences[j] = sequence
+
+    return sequences
+
+
+def decodeBatch(tables, sentences):
+    """
+    Runs predictViterbiArray over a batch of sentences of two or
+    more words as padded arrays
+
+    @param tables: output from buildTables2 function
+    @param sentences: list of lists of words
+
+    @return: list of predicted sequences
+    """
+    vocab = tables["vocab"]
+    logA = logTable(tables, "transitions")
+    logStop = logTable(tables, "stop")
+    lengths = np.array([len(sentence) for sentence in sentences])
+    B, L, K = len(sentences), lengths.max(), len(vocab.tags)
+
+    # Replace word with #UNK# if not in train, padding is #UNK# too
+    with instrument.timer("part4.normalize"):
+        ids = np.full((B, L), UNK_ID)
+        for b, sentence in enumerate(sentences):
+            ids[b, :len(sentence)] = vocab.encode(sentence)
+    emit = logRows(tables, "emissions", ids)
+    if instrument.enabled:
+        for b in range(B):
+            countStates("part4", ids[b, :lengths[b]], emit[b, :lengths[b]])
+    parents = np.empty((L, B, K, K), dtype=np.int16)
+    survived = np.empty((L, B, K, K), dtype=bool)
+
+    # base case, history is (_START, _START)
+    first = logA[K, K] + emit[:, 0]
+    pie = first[:, :, None] + logA[K, :K]
+    pie += emit[:, 1, None, :]
+    survived[1] = np.isfinite(pie)
+
+    # forward iterations, one (l, m, n) tensor per sentence and word
+    for i in range(2, L):
+        scores = pie[:, :, :, None] + logA[:K, :K]
+        scores += emit[:, i, None, None, :]
+        parents[i] = scores.argmax(axis=1)
+        active = (lengths > i)[:, None, None]
+        pie = np.where(active, scores.max(axis=1), pie)
+        survived[i] = np.isfinite(pie)
+
+    # stop case, ties go to the first (n, m) like predictViterbiList
+    rows = np.arange(B)
+    fallback = np.isfinite(emit).argmax(axis=2)
+    scores = (pie + logStop[:K, :K]).transpose(0, 2, 1).reshape(B, K * K)
+    best = scores.argmax(axis=1)
+    found = np.isfinite(scores[rows, best])
+    parent = np.where(found, best // K, fallback[rows, lengths - 1])
+    grandparent = np.where(found, best % K, 0)
+
+    # backtracking to get sequences, all sentences at once
+    # a -inf pie means no path survived, so parents[i] is meaningless
+    path = np.empty((B, L), dtype=np.intp)
+    path[rows, lengths - 1] = parent
+    path[rows, lengths - 2] = grandparent
+    for i in range(L - 1, 1, -1):
+        ok = survived[i, rows, grandparent, parent]
+        l = np.where(ok, parents[i, rows, grandparent, parent], fallback[:, i - 2])
+        active = lengths > i
+        parent = np.where(active, grandparent, parent)
+        grandparent = np.where(active, l, grandparent)
+        path[active, i - 2] = grandparent[active]
+
+    return [vocab.decode(path[b, :lengths[b]].tolist()) for b in range(B)]
+
+
+def getTables(datafolder):
+    """
+    Returns the saved model of a dataset, training and saving it first
+    if train has changed since it was saved
+
+    @param datafolder: folder with the train file of a dataset
+    @return: output from buildTables2 or loadModel function
+    """
     trainFile = datafolder / "train"
-    testFile = datafolder / "dev.in"
-    outputFile = datafolder / "dev.p4.out"
+    modelPath = datafolder / "model.p4"
+
+    if isFresh(modelPath, trainFile):
+        return loadModel(modelPath)
+
+    counts = countCorpus(trainFile)
+    emissions = estEmissions(trainFile, counts=counts)
+    transitions = estTransitions2(trainFile, counts=counts)
+    dictionary = getDictionary(trainFile, counts=counts)
+    tables = buildTables2(emissions, transitions, dictionary)
+    saveModel(modelPath, tables)
+
+    return tables
 
-    emissions = estEmissions(trainFile)
-    transitions = estTransitions2(trainFile)
-    dictionary = getDictionary(trainFile)
-    predictViterbiFile(emissions, transitions, dictionary, testFile, outputFile)
+
+def reportBeams(beams, datasets, outputFile="p4_beam_results"):
+    """
+    Decodes dev.in of each dataset exactly and with each beam width,
+    and writes the speed and F scores from evaluateFiles for each run
+
+    @param beams: list of beam widths to try
+    @param datasets: list of dataset folder names
+    @param outputFile: name of file to save the report to
+    """
+    # only the beam report needs these, so tagging does not load them
+    from tempfile import TemporaryDirectory
+    from evalResult import evaluateFiles
+
+    with open(outputFile, "w", encoding="utf-8") as f, TemporaryDirectory() as temp:
+        f.write("P4 Beam Results\n\n\n")
+        f.write("{:<4} {:>6} {:>12} {:>10} {:>15}\n".format(
+            "", "beam", "tokens/sec", "Entity F", "Entity Type F"))
+
+        for ds in datasets:
+            datafolder = Path(ds)
+            testFile = datafolder / "dev.in"
+            goldFile = datafolder / "dev.out"
+            tables = getTables(datafolder)
+
+            for beam in [None] + beams:
+                predictFile = Path(temp) / "{}.dev.p4.out".format(ds)
+                start = perf_counter()
+                count = predictViterbiFile(None, None, None, testFile, predictFile, tables, beam=beam)
+                elapsed = perf_counter() - start
+
+                result = evaluateFiles(goldFile, predictFile)
+                f.write("{:<4} {:>6} {:>12.0f} {:>10.4f} {:>15.4f}\n".format(
+                    ds, beam or "exact", count / elapsed,
+                    result["entity"]["f"], result["entityType"]["f"]))
+            f.write("\n")
 
     print("Output:", outputFile)
 
-print("Done!")
+
+# main
+# python part4.py [batchSize] also compares batch and per sentence speed
+# python part4.py beams [width ...] reports speed and F scores per beam width
+if __name__ == "__main__":
+    instrument.fromEnvironment()
+    datasets = ["EN", "FR", "CN", "SG"]
+    if len(sys.argv) > 1 and sys.argv[1] == "beams":
+        reportBeams([int(beam) for beam in sys.argv[2:]] or [1, 2, 4, 8, 16], datasets)
+        sys.exit()
+
+    batchSize = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    for ds in datasets:
+        datafolder = Path(ds)
+        testFile = datafolder / "dev.in"
+        outputFile = datafolder / "dev.p4.out"
+        tables = getTables(datafolder)
+
+        start = perf_counter()
+        count = predictViterbiFile(None, None, None, testFile, outputFile, tables)
+        elapsed = perf_counter() - start
+
+        print("Output:", outputFile)
+        print("{:.0f} tokens/sec".format(count / elapsed))
+        if batchSize is not None:
+            start = perf_counter()
+            predictViterbiFile(None, None, None, testFile, outputFile, tables, batchSize)
+            batchElapsed = perf_counter() - start
+            print("{:.0f} tokens/sec in batches of {}".format(count / batchElapsed, batchSize))
+
+    print("Done!")
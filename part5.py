@@ -1,16 +1,29 @@
+from math import sqrt
 from pathlib import Path
-import matplotlib.pyplot as plt
-import os
+from time import perf_counter
+import numpy as np
+from modelFile import saveModel, loadModel, isFresh
+from vocabulary import Vocabulary, UNK_ID
+from sharedFunctions import buildCandidates, getCandidates
+import instrument
 
 
 # Perceptron with tags sort by frequency
 
+# learning rate of epoch i, counted from 0, for each schedule train can use
+SCHEDULES = {
+    "inverse": lambda i: 1 / (i + 1),
+    "sqrt": lambda i: 1 / sqrt(i + 1),
+    "constant": lambda i: 1.0,
+}
+
+
 def predict(transitions, emissions, words, tokens, parent, word):
     """
     Given features about a word, return the most likely POS tag
 
     @param transitions: dict of transition scores
-    @param emissions: dict of emission scores
+    @param emissions: dict of emission scores, missing words score 0
     @return: Most likely tag
     """
     bestScore = 0
@@ -23,10 +36,7 @@ def predict(transitions, emissions, words, tokens, parent, word):
         if tag not in transitions[parent]:
             continue
 
-        if word not in emissions[tag]:
-            continue
-
-        score = transitions[parent][tag] + emissions[tag][word]
+        score = transitions[parent][tag] + emissions[tag].get(word, 0)
         if score > bestScore or bestTag is None:
             bestScore = score
             bestTag = tag
@@ -34,114 +44,245 @@ def predict(transitions, emissions, words, tokens, parent, word):
     return bestTag
 
 
-def initParams(file):
+def encodeCorpus(file):
     """
-    Get all possible tokens and words
-    and initialize transitions and emissions
+    Parse training file once into integer ids, so that training
+    epochs do not have to parse it again.
+    Tags are numbered by decreasing frequency
+
+    @return: (wordIds, tagIds, words, tokens) where wordIds and tagIds
+    hold one entry per line with tag id -1 for blank lines, words is the
+    list of words including #UNK# and tokens the sorted list of tags
     """
-    tokens = set()
-    words = {'#UNK#'}
+    vocab = Vocabulary()
+    tagIndex = {}
+    tagCounts = []
+    wordIds = []
+    tagIds = []
     with open(file) as f:
         for line in f:
             temp = line.strip()
 
-            # ignore empty lines
+            # blank lines end sentences
             if len(temp) == 0:
+                wordIds.append(-1)
+                tagIds.append(-1)
                 continue
 
             last_space_index = temp.rfind(" ")
             x = temp[:last_space_index].lower()
             y = temp[last_space_index + 1:]
 
-            tokens.add(y)
-            words.add(x)
-
-    transitions = {}
-    emissions = {}
-    for u in tokens.union({'_START'}):
-        for v in tokens.union({'_STOP'}):
-            if u not in transitions:
-                transitions[u] = {v: 0}
-            else:
-                transitions[u][v] = 0
+            if y not in tagIndex:
+                tagIndex[y] = len(tagIndex)
+                tagCounts.append(0)
+            tagCounts[tagIndex[y]] += 1
 
-    for u in tokens:
-        for word in words:
-            if u not in emissions:
-                emissions[u] = {word: 0}
-            else:
-                emissions[u][word] = 0
+            wordIds.append(vocab.addWord(x))
+            tagIds.append(tagIndex[y])
 
-    tokens = {token: 0 for token in tokens}
+    # sort tokens, and renumber tags in that order
+    tokens = list(tagIndex.keys())
+    tokens.sort(key=lambda y: tagCounts[tagIndex[y]], reverse=True)
+    order = {tagIndex[y]: i for i, y in enumerate(tokens)}
+    order[-1] = -1
+    tagIds = [order[y] for y in tagIds]
 
-    return transitions, emissions, words, tokens
+    return wordIds, tagIds, vocab.words, tokens
 
 
-def train(file, epoch):
+def train(file, epoch, verbose=False, schedule="inverse", encoded=None, onEpoch=None):
     """
     Given training file, return transitions and emissions
     trained using perceptron algorithm
+
+    @param verbose: print the time taken by each epoch
+    @param schedule: name of the learning rate schedule in SCHEDULES
+    @param encoded: output from encodeCorpus function. If given,
+    file is not read again
+    @param onEpoch: if given, called after each epoch with the number
+    of epochs done and a function that returns what train would
+    return if it stopped there
+    """
+    if encoded is None:
+        with instrument.timer("part5.encode"):
+            encoded = encodeCorpus(file)
+    wordIds, tagIds, words, tokens = encoded
+    learnrates = SCHEDULES[schedule]
+    start = len(tokens)
+    stop = len(tokens)
+
+    # transitions[u][v], with u == start for _START and v == stop for _STOP
+    # emissions[tag] only holds words whose weight has been updated
+    transitions = [[0] * (len(tokens) + 1) for _ in range(len(tokens) + 1)]
+    emissions = [{} for _ in tokens]
+
+    # back to the dicts predict uses
+    def weights():
+        transitionDict = {}
+        for u, name in enumerate(tokens + ["_START"]):
+            transitionDict[name] = {v: transitions[u][j] for j, v in enumerate(tokens + ["_STOP"])}
+        emissionDict = {tokens[tag]: {words[x]: weight for x, weight in xDict.items()}
+                        for tag, xDict in enumerate(emissions)}
+
+        return transitionDict, emissionDict, set(words), tokens
+
+    # train weights
+    for i in range(epoch):
+        epochStart = perf_counter()
+        prev = start
+        learnrate = learnrates(i)
+        for x, y in zip(wordIds, tagIds):
+
+            # Sentence has ended
+            if y < 0:
+                transitions[prev][stop] += 1
+                prev = start
+                continue
+
+            # Predict and update, same as predict with tags in sorted order
+            row = transitions[prev]
+            bestScore = 0
+            prediction = None
+            for tag in range(len(tokens)):
+                score = row[tag] + emissions[tag].get(x, 0)
+                if score > bestScore or prediction is None:
+                    bestScore = score
+                    prediction = tag
+
+            if prediction != y:
+                row[y] += learnrate
+                emissions[y][x] = emissions[y].get(x, 0) + learnrate
+
+                row[prediction] -= learnrate
+                emissions[prediction][x] = emissions[prediction].get(x, 0) - learnrate
+
+            prev = y
+
+        instrument.observe("part5.epoch", perf_counter() - epochStart)
+        if verbose:
+            print("Epoch {}: {:.2f}s".format(i + 1, perf_counter() - epochStart))
+        if onEpoch is not None:
+            onEpoch(i + 1, weights)
+
+    return weights()
+
+
+def buildModel(transitions, emissions, words, tokens):
+    """
+    Packs trained weights into arrays that can be saved with saveModel.
+    Tag id K stands for _START in transition rows and for _STOP in
+    transition columns
+
+    @param transitions, emissions, words, tokens: output from train function
+
+    @return Dict: {"kind": "perceptron", "vocab": Vocabulary,
+                   "emissions": (V, K) array, "transitions": (K+1, K+1) array}
+    """
+    vocab = Vocabulary(sorted(words), tokens)
+    K = len(vocab.tags)
+
+    transitionArray = np.zeros((K + 1, K + 1))
+    for u, vDict in transitions.items():
+        for v, weight in vDict.items():
+            transitionArray[vocab.tagId(u), vocab.tagId(v)] = weight
+
+    emissionArray = np.zeros((len(vocab), K))
+    for tag, xDict in emissions.items():
+        for x, weight in xDict.items():
+            emissionArray[vocab.wordId(x), vocab.tagId(tag)] = weight
+
+    return {
+        "kind": "perceptron",
+        "vocab": vocab,
+        "emissions": emissionArray,
+        "transitions": transitionArray,
+    }
+
+
+def buildCandidateIndex(file, vocab):
     """
-    transitions, emissions, words, tokens = initParams(file)
+    Indexes the tags each word was labelled with in the training file,
+    for the candidates option of predictArray. Unknown words can take
+    any tag
 
+    @param vocab: vocabulary of the output from buildModel function
+    @return Dict: output from buildCandidates function
+    """
+    allowed = np.zeros((len(vocab), len(vocab.tags)), dtype=bool)
+    allowed[UNK_ID] = True
     with open(file) as f:
-        # sort tokens
         for line in f:
             temp = line.strip()
-
             if len(temp) == 0:
                 continue
 
             last_space_index = temp.rfind(" ")
+            x = temp[:last_space_index].lower()
             y = temp[last_space_index + 1:]
-            tokens[y] += 1
-        f.seek(0)
+            allowed[vocab.wordId(x), vocab.tagId(y)] = True
+
+    return buildCandidates(allowed)
 
-        sortedTokens = list(tokens.keys())
-        sortedTokens.sort(key=lambda x: tokens[x], reverse=True)
 
-        # train weights
-        for i in range(epoch):
-            prev = "_START"
-            learnrate = 1 / (i + 1)
-            for line in f:
-                temp = line.strip()
+def predictArray(model, parent, word, candidates=False):
+    """
+    Same as predict but on the arrays from buildModel or loadModel
+
+    @param model: output from buildModel or loadModel function
+    @param parent: tag id of the previous word, K for _START
+    @param candidates: if True, only tags the word was labelled with in
+    train are scored, using the index from buildCandidateIndex. Unlike
+    the Viterbi models this can change the prediction, so it is off by default
+    @return: Most likely tag id
+    """
+    vocab = model["vocab"]
+    x = vocab.wordId(word)
+    if candidates:
+        tags = getCandidates(model)[x]
+        if len(tags) == 1:
+            return int(tags[0])
+        scores = model["transitions"][parent, tags] + model["emissions"][x, tags]
+        return int(tags[scores.argmax()])
 
-                # Sentence has ended
-                if len(temp) == 0:
-                    transitions[prev]['_STOP'] += 1
-                    prev = '_START'
-                    continue
+    K = len(vocab.tags)
+    scores = model["transitions"][parent, :K] + model["emissions"][x]
 
-                # Sentence has not ended
-                else:
-                    last_space_index = temp.rfind(" ")
-                    x = temp[:last_space_index].lower()
-                    y = temp[last_space_index + 1:]
-                    tokens[y] += 1
+    return int(scores.argmax())
 
-                # Predict and update
-                prediction = predict(transitions, emissions, words,
-                                     sortedTokens, prev, x)
-                if prediction != y:
-                    transitions[prev][y] += learnrate
-                    emissions[y][x] += learnrate
 
-                    transitions[prev][prediction] -= learnrate
-                    emissions[prediction][x] -= learnrate
+def predictSentenceArray(model, textList, candidates=False):
+    """
+    Predicts tags for a list of words with predictArray
 
-                prev = y
+    @param model: output from buildModel or loadModel function
+    @param textList: list of words
+    @param candidates: same as in predictArray
+    @return: list of predicted tags
+    """
+    tags = model["vocab"].tags
+    sequence = []
 
-            f.seek(0)
+    prev = len(tags)
+    for word in textList:
+        prev = predictArray(model, prev, word.lower(), candidates)
+        sequence.append(tags[prev])
 
-    return transitions, emissions, words, sortedTokens
+    return sequence
 
 
-def predictAll(trainFile, testFile, outputFile, epoch):
+def predictAll(trainFile, testFile, outputFile, epoch, model=None):
     """
     Given a file of sentences, predict POS tag sequences
     for each sentence using Viterbi Algorithm
+
+    @param model: output from buildModel or loadModel function.
+    If given, it is used instead of training on trainFile
     """
+    if model is not None:
+        predictModelFile(model, testFile, outputFile)
+        return
+
     transitions, emissions, words, tokens = train(trainFile, epoch)
 
     with open(testFile) as f,\
@@ -166,29 +307,85 @@ def predictAll(trainFile, testFile, outputFile, epoch):
                 prev = prediction
 
 
-# main
-folder = input("Which language do you wish to use? (EN/FR/CN/SG) \n")
-dataset = input("dev, test or test2? \n")
+def predictModelFile(model, testFile, outputFile):
+    """
+    Same as predictAll but with a model from buildModel or loadModel
+    """
+    with open(testFile) as f,\
+         open(outputFile, "w") as out:
+        predictModelStream(model, f, out)
 
-if folder.upper() not in ["EN", "FR", "CN", "SG"]:
-    print("Please choose either EN, FR, CN or SG")
 
-elif dataset.lower() not in ["dev", "test", "test2"]:
-    print("Please choose either dev, test or test2")
+def predictModelStream(model, lines, out, candidates=False):
+    """
+    Same as predictModelFile but reads lines from any iterable and
+    writes to any file-like object, so it can tag part of a file
 
-else:
-    # Prepare file paths
-    datafolder = Path(folder.upper())
-    trainFile = datafolder / "train"
-    testFile = datafolder / "{}.in".format(dataset.lower())
-    outputFile = datafolder / "{}.p5.out".format(dataset.lower())
+    @param lines: iterable of lines of unlabelled text
+    @param out: file-like object to write labelled text to
+    @param candidates: same as in predictArray
+    """
+    tags = model["vocab"].tags
+    if instrument.enabled:
+        lines = instrument.countWords(lines, "part5", model["vocab"])
 
-    # Train and predict
-    epochs = 20
-    if folder == "FR":
-        epochs = 23
+    with instrument.timer("part5.tag"):
+        prev = len(tags)
+        for line in lines:
+            temp = line.strip()
 
-    predictAll(trainFile, testFile, outputFile, epochs)
+            # Sentence has ended
+            if len(temp) == 0:
+                out.write("\n")
+                prev = len(tags)
 
-    print("Output:", outputFile)
-    print("Done!")
+            # Sentence has not ended
+            else:
+                word = temp.lower()
+
+                # find most likely tag for word
+                prediction = predictArray(model, prev, word, candidates)
+                out.write("{} {}\n".format(word, tags[prediction]))
+                prev = prediction
+
+
+# main
+if __name__ == "__main__":
+    instrument.fromEnvironment()
+    folder = input("Which language do you wish to use? (EN/FR/CN/SG) \n")
+    dataset = input("dev, test or test2? \n")
+
+    if folder.upper() not in ["EN", "FR", "CN", "SG"]:
+        print("Please choose either EN, FR, CN or SG")
+
+    elif dataset.lower() not in ["dev", "test", "test2"]:
+        print("Please choose either dev, test or test2")
+
+    else:
+        # Prepare file paths
+        datafolder = Path(folder.upper())
+        trainFile = datafolder / "train"
+        testFile = datafolder / "{}.in".format(dataset.lower())
+        outputFile = datafolder / "{}.p5.out".format(dataset.lower())
+        modelPath = datafolder / "model.p5"
+
+        # Train and predict
+        epochs = 20
+        if folder == "FR":
+            epochs = 23
+
+        # reuse the saved weights unless train, epochs or schedule have changed since
+        model = None
+        if isFresh(modelPath, trainFile):
+            model = loadModel(modelPath)
+        if model is None or model["meta"].get("epochs") != epochs or \
+           model["meta"].get("schedule", "inverse") != "inverse":
+            model = buildModel(*train(trainFile, epochs, verbose=True))
+            model.update(buildCandidateIndex(trainFile, model["vocab"]))
+            model["meta"] = {"epochs": epochs}
+            saveModel(modelPath, model)
+
+        predictAll(trainFile, testFile, outputFile, epochs, model)
+
+        print("Output:", outputFile)
+        print("Done!")
@@ -0,0 +1,214 @@
+import asyncio
+import json
+import os
+import sys
+from modelFile import loadModel
+from tagger import tagSentences, tagSentencesCached
+from decodeCache import DecodeCache
+
+# how long the first request of a batch waits for others to join it
+BATCH_WINDOW = 0.005
+
+# most sentences decoded in one batch
+MAX_BATCH = 512
+
+# how often the model file is checked for a new version, in seconds
+RELOAD_INTERVAL = 1.0
+
+
+class TaggingServer:
+    """
+    Tags sentences sent over HTTP with a model loaded once. Requests that
+    arrive within BATCH_WINDOW of each other are decoded as one batch,
+    and the model is reloaded when its file changes. A batch keeps the
+    model it started with, so a reload never drops a request. With a
+    cache, sentences seen before are not decoded again; the cache is
+    emptied by the first batch decoded with a reloaded model
+    """
+
+    def __init__(self, modelPath, window=BATCH_WINDOW, maxBatch=MAX_BATCH, cacheSize=0):
+        self.modelPath = modelPath
+        self.window = window
+        self.maxBatch = maxBatch
+        self.cache = DecodeCache(cacheSize) if cacheSize else None
+        self.model = loadModel(modelPath)
+        self.version = 1
+        self.stamp = self.modelStamp()
+        self.queue = asyncio.Queue()
+
+    def modelStamp(self):
+        """
+        Returns what identifies the model file on disk. saveModel replaces
+        the file, so a new model always has a new inode or mtime
+        """
+        stat = os.stat(self.modelPath)
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    async def tag(self, sentences):
+        """
+        Queues sentences for the next batch and waits for their tags
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((sentences, future))
+        return await future
+
+    async def batcher(self):
+        """
+        Collects queued requests into batches and decodes each batch
+        off the event loop
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            requests = [await self.queue.get()]
+            size = len(requests[0][0])
+            deadline = loop.time() + self.window
+
+            while size < self.maxBatch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                requests.append(request)
+                size += len(request[0])
+
+            sentences = [sentence for request in requests for sentence in request[0]]
+            try:
+                if self.cache is None:
+                    sequences = await loop.run_in_executor(None, tagSentences, self.model, sentences)
+                else:
+                    sequences = await loop.run_in_executor(None, tagSentencesCached, self.model,
+                                                           sentences, self.cache)
+            except Exception as e:
+                for _, future in requests:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for sentencesIn, future in requests:
+                if not future.done():
+                    future.set_result(sequences[:len(sentencesIn)])
+                sequences = sequences[len(sentencesIn):]
+
+    async def watcher(self):
+        """
+        Reloads the model when its file is replaced
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(RELOAD_INTERVAL)
+            try:
+                stamp = self.modelStamp()
+                if stamp == self.stamp:
+                    continue
+                model = await loop.run_in_executor(None, loadModel, self.modelPath)
+            except (OSError, ValueError) as e:
+                print("Could not reload {}: {}".format(self.modelPath, e), file=sys.stderr)
+                continue
+
+            self.model = model
+            self.stamp = stamp
+            self.version += 1
+            print("Reloaded {} (version {})".format(self.modelPath, self.version), file=sys.stderr)
+
+    async def handle(self, reader, writer):
+        """
+        Serves HTTP requests on one connection.
+        POST /tag with {"sentences": [[word]]} returns {"tags": [[tag]]},
+        GET /health returns the model kind and version, and cache counts
+        """
+        try:
+            while True:
+                requestLine = await reader.readline()
+                if not requestLine:
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = headers.get("content-length", "0")
+                if not length.isdigit():
+                    # the body cannot be found, so the connection cannot be reused
+                    await self.send(writer, "400 Bad Request", {"error": "bad Content-Length header"})
+                    break
+
+                body = await reader.readexactly(int(length))
+                status, response = await self.respond(requestLine.decode("latin-1").split(), body)
+                await self.send(writer, status, response)
+
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def send(self, writer, status, response):
+        """
+        Writes one HTTP response with a JSON body
+        """
+        payload = json.dumps(response, ensure_ascii=False).encode("utf-8")
+        writer.write("HTTP/1.1 {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n\r\n"
+                     .format(status, len(payload)).encode("latin-1") + payload)
+        await writer.drain()
+
+    async def respond(self, request, body):
+        """
+        Returns the status line and JSON response for one HTTP request
+        """
+        if len(request) < 2:
+            return "400 Bad Request", {"error": "bad request line"}
+        method, path = request[0], request[1]
+
+        if method == "GET" and path == "/health":
+            health = {"kind": self.model["kind"], "version": self.version}
+            if self.cache is not None:
+                health["cache"] = self.cache.stats()
+            return "200 OK", health
+
+        if method != "POST" or path != "/tag":
+            return "404 Not Found", {"error": "use POST /tag or GET /health"}
+
+        try:
+            sentences = json.loads(body.decode("utf-8"))["sentences"]
+            if not isinstance(sentences, list) or not all(
+                    isinstance(sentence, list) and all(isinstance(word, str) for word in sentence)
+                    for sentence in sentences):
+                raise ValueError
+        except (ValueError, KeyError, TypeError):
+            return "400 Bad Request", {"error": 'expected {"sentences": [[word, ...], ...]}'}
+
+        return "200 OK", {"tags": await self.tag(sentences)}
+
+
+async def serve(modelPath, address, cacheSize=0):
+    """
+    Serves modelPath on a TCP port, or on a Unix socket if address is a path
+    """
+    server = TaggingServer(modelPath, cacheSize=cacheSize)
+    if address.isdigit():
+        listener = await asyncio.start_server(server.handle, "127.0.0.1", int(address))
+    else:
+        listener = await asyncio.start_unix_server(server.handle, address)
+
+    print("Serving {} on {}".format(modelPath, address), file=sys.stderr)
+    async with listener:
+        await asyncio.gather(listener.serve_forever(), server.batcher(), server.watcher())
+
+
+# main
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python server.py [model file] [port or socket path] [cache size]")
+        sys.exit()
+
+    address = sys.argv[2] if len(sys.argv) > 2 else "8080"
+    cacheSize = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+    asyncio.run(serve(sys.argv[1], address, cacheSize))
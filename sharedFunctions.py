@@ -1,3 +1,21 @@
+from math import log
+import io
+import os
+import numpy as np
+from vocabulary import Vocabulary, UNK_ID
+from corpus import Corpus
+import instrument
+
+# storage types of the log tables built by buildTables and buildTables2
+PRECISIONS = ("float64", "float32", "int16")
+
+# int16 tables hold round(log p * scale), with this value for log 0
+QUANTIZED_MISSING = np.iinfo(np.int16).min
+
+# names of the log tables in the output of buildTables and buildTables2
+LOG_TABLES = ("emissions", "transitions", "start", "stop")
+
+
 def incrementCount(parent, child, d):
     """
     Increment the count of [parent][child] in dictionary d
@@ -11,170 +29,534 @@ def incrementCount(parent, child, d):
         d[parent] = {child: 1}
 
 
-def estEmissions(file, k=1):
+def countCorpus(file):
     """
-    Given training file, return emission parameters
+    Given training file, return all the counts needed by estEmissions,
+    estTransitions, estTransitions2 and getDictionary in a single pass
 
-    @param k: Words appearing less than k times will be
-    replaced with #UNK#
+    @return Dict: output from countLines function
+    """
+    with instrument.timer("countCorpus"), open(file, encoding="utf-8") as f:
+        counts = countLines(f)
 
-    @return Dict: {tag: {word: emission}}
+    if instrument.enabled:
+        instrument.count("train.tokens", sum(counts["tags"].values()))
+    return counts
+
+
+def countLines(lines):
     """
+    Same as countCorpus but counts any iterable of training lines
+
+    @return Dict: {"emissions": {y: {x: count(y->x)}},
+                   "tags": {y: count(y)},
+                   "transitions": {y_prev: {y_curr: count}},
+                   "histories": {y_prev: count(y_prev)},
+                   "transitions2": {(y_jm2, y_jm1): {y_j: count}},
+                   "histories2": {(y_jm2, y_jm1): count(y_jm2, y_jm1)},
+                   "words": set of all words}
+    """
+    start = "_START"
+    stop = "_STOP"
     emissions = {}
-    yCounts = {}
+    tags = {}
+    transitions = {}
+    histories = {start: 0}
+    transitions2 = {}
+    histories2 = {(start, start): 0}
+    words = set()
+    y_jm2 = start
+    y_jm1 = start
 
-    with open(file, encoding="utf-8") as f:
-        for line in f:
-            temp = line.strip()
+    for line in lines:
+        temp = line.strip()
 
-            # ignore empty lines
-            if len(temp) == 0:
-                continue
+        # sentence has ended
+        if len(temp) == 0:
+            incrementCount(y_jm1, stop, transitions)
+            incrementCount((y_jm2, y_jm1), stop, transitions2)
+            y_jm2 = start
+            y_jm1 = start
+
+        # part of a sentence
+        else:
+            last_space_index = temp.rfind(" ")
+            x = temp[:last_space_index].lower()
+            y_j = temp[last_space_index + 1:]
+
+            # update count(start) if new sentence
+            if y_jm1 == start:
+                histories[start] += 1
+                histories2[(start, start)] += 1
+
+            # update count(y), count(y_jm1, y_j)
+            if y_j in tags:
+                tags[y_j] += 1
             else:
-                last_space_index = temp.rfind(" ")
-                x = temp[:last_space_index].lower()
-                y = temp[last_space_index + 1:]
+                tags[y_j] = 1
 
-                # update count(y)
-                if y in yCounts:
-                    yCounts[y] += 1
-                else:
-                    yCounts[y] = 1
+            if (y_jm1, y_j) in histories2:
+                histories2[(y_jm1, y_j)] += 1
+            else:
+                histories2[(y_jm1, y_j)] = 1
 
-                # update count(y->x)
-                incrementCount(y, x, emissions)
+            # update count(y->x), count(prev, curr)
+            incrementCount(y_j, x, emissions)
+            incrementCount(y_jm1, y_j, transitions)
+            incrementCount((y_jm2, y_jm1), y_j, transitions2)
+            words.add(x)
 
-    # convert counts to emissions
-    for y, xDict in emissions.items():
-        for x, xCount in xDict.items():
-            xDict[x] = xCount / float(yCounts[y] + k)
+            y_jm2 = y_jm1
+            y_jm1 = y_j
 
-        emissions[y]["#UNK#"] = k / float(yCounts[y] + k)
+    # add count(prev, stop) if no blank lines at EOF
+    # estTransitions2 has never done this, so only first order gets it
+    if y_jm1 != start:
+        incrementCount(y_jm1, stop, transitions)
 
-    return emissions
+    histories.update(tags)
 
+    return {
+        "emissions": emissions,
+        "tags": tags,
+        "transitions": transitions,
+        "histories": histories,
+        "transitions2": transitions2,
+        "histories2": histories2,
+        "words": words,
+    }
 
-def estTransitions(file):
+
+def mergeCounts(total, counts):
     """
-    Given training file, return transition parameters
+    Adds the counts from one shard of a corpus into total, in place.
+    Shards must be merged in corpus order for the result to match
+    countCorpus over the whole corpus exactly
 
-    @return Dict: {y_prev: {y_curr: transition}}
+    @param total: output from countLines function, updated in place
+    @param counts: output from countLines function
+    @return Dict: total
     """
-    start = "_START"
-    stop = "_STOP"
-    transitions = {}
-    yCounts = {start: 0}
-    prev = start
-    with open(file, encoding="utf-8") as f:
-        for line in f:
-            temp = line.strip()
-
-            # sentence has ended
-            if len(temp) == 0:
-                incrementCount(prev, stop, transitions)
-                prev = start
-
-            # part of a sentence
-            else:
-                last_space_index = temp.rfind(" ")
-                curr = temp[last_space_index + 1:]
+    for name in ("tags", "histories", "histories2"):
+        for key, count in counts[name].items():
+            total[name][key] = total[name].get(key, 0) + count
+
+    for name in ("emissions", "transitions", "transitions2"):
+        for parent, children in counts[name].items():
+            if parent not in total[name]:
+                total[name][parent] = {}
+            for child, count in children.items():
+                total[name][parent][child] = total[name][parent].get(child, 0) + count
+
+    total["words"].update(counts["words"])
+
+    return total
+
+
+def countShard(file, begin, end):
+    """
+    Counts the lines between byte offsets begin and end of a training file
+
+    @return Dict: output from countLines function
+    """
+    with open(file, "rb") as f:
+        f.seek(begin)
+        data = f.read(end - begin)
+
+    return countLines(io.TextIOWrapper(io.BytesIO(data), encoding="utf-8"))
+
+
+def countCorpusParallel(file, workers=None, shards=None):
+    """
+    Same as countCorpus, but counts sentence aligned shards of the file,
+    found with its Corpus index, on a pool of processes and merges the
+    counts in file order at the end
+
+    @param workers: number of processes, defaults to the number of CPUs
+    @param shards: number of shards, defaults to 4 per worker
+
+    @return Dict: output from countLines function
+    """
+    # imported here, so importing this module stays quick for single process jobs
+    from concurrent.futures import ProcessPoolExecutor
 
-                # update count(start) if new sentence
-                if prev == start:
-                    yCounts[start] += 1
+    workers = workers or os.cpu_count()
+    with Corpus(file) as corpus:
+        ranges = [corpus.byteRange(first, last) for first, last in corpus.chunks(shards or 4 * workers)]
+    if not ranges:
+        return countLines([])
+    files = [file] * len(ranges)
 
-                # update count(y)
-                if curr in yCounts:
-                    yCounts[curr] += 1
-                else:
-                    yCounts[curr] = 1
+    with instrument.timer("countCorpusParallel"), ProcessPoolExecutor(workers) as pool:
+        results = pool.map(countShard, files, *zip(*ranges))
+        total = next(results)
+        for counts in results:
+            mergeCounts(total, counts)
 
-                # update count(prev, curr)
-                incrementCount(prev, curr, transitions)
+    return total
 
-                prev = curr
 
-        # add count(prev, stop) if no blank lines at EOF
-        if prev != start:
-            incrementCount(prev, stop, transitions)
-            prev = start
+def estEmissions(file, k=1, counts=None):
+    """
+    Given training file, return emission parameters
+
+    @param k: Words appearing less than k times will be
+    replaced with #UNK#
+    @param counts: output from countCorpus or countCorpusParallel
+    function. If given, file is not read again
+
+    @return Dict: {tag: {word: emission}}
+    """
+    if counts is None:
+        counts = countCorpus(file)
+    yCounts = counts["tags"]
 
-    # convert counts to transitions
-    for prev, currDict in transitions.items():
-        for curr, currCount in currDict.items():
-            currDict[curr] = currCount / float(yCounts[prev])
+    with instrument.timer("estEmissions"):
+        # convert counts to emissions
+        emissions = {}
+        for y, xDict in counts["emissions"].items():
+            emissions[y] = {x: xCount / float(yCounts[y] + k) for x, xCount in xDict.items()}
+            emissions[y]["#UNK#"] = k / float(yCounts[y] + k)
+
+    return emissions
+
+
+def estTransitions(file, counts=None):
+    """
+    Given training file, return transition parameters
+
+    @param counts: output from countCorpus or countCorpusParallel
+    function. If given, file is not read again
+
+    @return Dict: {y_prev: {y_curr: transition}}
+    """
+    if counts is None:
+        counts = countCorpus(file)
+    yCounts = counts["histories"]
+
+    with instrument.timer("estTransitions"):
+        # convert counts to transitions
+        transitions = {}
+        for prev, currDict in counts["transitions"].items():
+            transitions[prev] = {curr: currCount / float(yCounts[prev])
+                                 for curr, currCount in currDict.items()}
 
     return transitions
 
 
-def estTransitions2(file):
+def estTransitions2(file, counts=None):
     """
     Given training file, return transition parameters
 
+    @param counts: output from countCorpus or countCorpusParallel
+    function. If given, file is not read again
+
     @return Dict: {(y_jm2,y_jm1): {y_j: transition}}
     """
-    start = "_START"
-    stop = "_STOP"
-    transitions = {}
-    yCounts = {(start, start): 0}
-    y_jm2 = start
-    y_jm1 = start
-    with open(file, encoding="utf-8") as f:
-        for line in f:
-            temp = line.strip()
+    if counts is None:
+        counts = countCorpus(file)
+    yCounts = counts["histories2"]
+
+    with instrument.timer("estTransitions2"):
+        # convert counts to transitions
+        # parents are (y_jm2, y_jm1) pairs, children are possible y_j's
+        transitions = {}
+        for parents, children in counts["transitions2"].items():
+            transitions[parents] = {currTag: currCount / float(yCounts[parents])
+                                    for currTag, currCount in children.items()}
 
-            # sentence has ended
-            if len(temp) == 0:
-                incrementCount((y_jm2, y_jm1), stop, transitions)
-                y_jm2 = start
-                y_jm1 = start
-
-            # part of a sentence
-            else:
-                last_space_index = temp.rfind(" ")
-                y_j = temp[last_space_index + 1:]
-
-                # update count(start) if new sentence
-                if (y_jm2, y_jm1) == (start, start):
-                    yCounts[(y_jm2, y_jm1)] += 1
-
-                # update count(y)
-                if (y_jm1, y_j) in yCounts:
-                    yCounts[(y_jm1, y_j)] += 1
-                else:
-                    yCounts[(y_jm1, y_j)] = 1
-
-                # update count(prev, curr)
-                incrementCount((y_jm2, y_jm1), y_j, transitions)
-
-                y_jm2 = y_jm1
-                y_jm1 = y_j
-
-    # convert counts to transitions
-    # parents are (y_jm2, y_jm1) pairs, children are possible y_j's
-    for parents, children in transitions.items():
-        for currTag, currCount in children.items():
-            children[currTag] = currCount / float(yCounts[parents])
     return transitions
 
 
-def getDictionary(file):
+def getDictionary(file, counts=None):
     """
     Given training file, return set of all words
 
+    @param counts: output from countCorpus or countCorpusParallel
+    function. If given, file is not read again
+
     @return Set: set of all words in file
     """
-    out = set()
-    with open(file, encoding="utf-8") as f:
-        for line in f:
-            temp = line.strip()
+    if counts is None:
+        counts = countCorpus(file)
+
+    return set(counts["words"])
+
+
+def buildEmissionTable(emissions, dictionary):
+    """
+    Given emission parameters, return the vocabulary and a (V, K)
+    array of log emissions with -inf for missing entries.
+    Tags keep the order of emissions
+
+    @param emissions: output from estEmissions function
+    @param dictionary: output from getDictionary function
+
+    @return Tuple: (Vocabulary, (V, K) array)
+    """
+    vocab = Vocabulary(dictionary, emissions.keys())
+
+    logE = np.full((len(vocab), len(vocab.tags)), -np.inf)
+    for tag, xDict in emissions.items():
+        for x, p in xDict.items():
+            if x in vocab and p != 0:
+                logE[vocab.wordId(x), vocab.tagId(tag)] = log(p)
+
+    return vocab, logE
+
+
+def countStates(part, ids, emit):
+    """
+    Records for instrument how many words were unknown, and how many
+    (word, tag) states a decoder expands or skips because the tag
+    cannot emit the word
+
+    @param part: prefix of the counters, such as "part3"
+    @param ids: word ids of one sentence
+    @param emit: log emission rows of the same words
+    """
+    skipped = int(np.isneginf(emit).sum())
+    instrument.count(part + ".unk", int(np.count_nonzero(np.asarray(ids) == UNK_ID)))
+    instrument.count(part + ".statesExpanded", emit.size - skipped)
+    instrument.count(part + ".statesSkipped", skipped)
+
+
+def buildCandidates(allowed):
+    """
+    Indexes the tags each word can take, so decoders can skip the
+    others instead of finding them -inf
+
+    @param allowed: (V, K) bool array, True where a word can take a tag
+
+    @return Dict: {"candidateOffsets": (V+1,) array, "candidateTags": array},
+    the candidate tag ids of word id i being
+    candidateTags[candidateOffsets[i]:candidateOffsets[i+1]], in tag order
+    """
+    offsets = np.zeros(len(allowed) + 1, dtype=np.int64)
+    np.cumsum(allowed.sum(axis=1), out=offsets[1:])
+    return {
+        "candidateOffsets": offsets,
+        "candidateTags": np.nonzero(allowed)[1].astype(np.intp),
+    }
+
+
+def getCandidates(tables):
+    """
+    Returns the candidate tag ids of every word id as a list of arrays,
+    split once from the index of buildCandidates and kept in
+    tables["candidates"], which saveModel ignores. HMM tables saved
+    without an index get one from their emissions
+
+    @param tables: output from buildTables, buildTables2 or loadModel function
+    """
+    if "candidates" not in tables:
+        if "candidateOffsets" not in tables:
+            if tables["kind"] not in ("first", "second"):
+                raise ValueError("{} model has no candidate index".format(tables["kind"]))
+            tables.update(buildCandidates(emitting(tables["emissions"])))
+
+        offsets = tables["candidateOffsets"]
+        tables["candidates"] = np.split(np.asarray(tables["candidateTags"]), offsets[1:-1])
+
+    return tables["candidates"]
+
+
+def emitting(logE):
+    """
+    Returns where a log emission table, of any precision, is not -inf
+    """
+    if logE.dtype == np.int16:
+        return logE != QUANTIZED_MISSING
+    return np.isfinite(logE)
+
 
-            # ignore empty lines
-            if len(temp) == 0:
+def buildTables(emissions, transitions, dictionary, precision="float64"):
+    """
+    Given emission and transition parameters, return log probability
+    tables indexed by tag and word ids. Zero probabilities are stored
+    as -inf so that they never win a max.
+
+    @param emissions: output from estEmissions function
+    @param transitions: output from estTransitions function
+    @param dictionary: output from getDictionary function
+    @param precision: storage of the tables, one of PRECISIONS
+
+    @return Dict: {"kind": "first", "vocab": Vocabulary,
+                   "emissions": (V, K) array, "transitions": (K, K) array,
+                   "start": (K,) array, "stop": (K,) array,
+                   and the candidate index from buildCandidates}
+    """
+    with instrument.timer("buildTables"):
+        vocab, logE = buildEmissionTable(emissions, dictionary)
+        tags = vocab.tags
+        tagIndex = vocab.tagIds
+
+        logA = np.full((len(tags), len(tags)), -np.inf)
+        logStart = np.full(len(tags), -np.inf)
+        logStop = np.full(len(tags), -np.inf)
+        for prev, currDict in transitions.items():
+            for curr, p in currDict.items():
+                if p == 0 or (curr not in tagIndex and curr != "_STOP"):
+                    continue
+
+                if prev == "_START" and curr != "_STOP":
+                    logStart[tagIndex[curr]] = log(p)
+                elif prev in tagIndex and curr == "_STOP":
+                    logStop[tagIndex[prev]] = log(p)
+                elif prev in tagIndex:
+                    logA[tagIndex[prev], tagIndex[curr]] = log(p)
+
+    return setPrecision({
+        "kind": "first",
+        "vocab": vocab,
+        "emissions": logE,
+        "transitions": logA,
+        "start": logStart,
+        "stop": logStop,
+        **buildCandidates(emitting(logE)),
+    }, precision)
+
+
+def buildTables2(emissions, transitions, dictionary, precision="float64"):
+    """
+    Given emission and second order transition parameters, return
+    log probability tables indexed by tag and word ids. Tag id K,
+    the vocabulary's boundary id, stands for _START in the transition
+    tensors.
+
+    @param emissions: output from estEmissions function
+    @param transitions: output from estTransitions2 function
+    @param dictionary: output from getDictionary function
+    @param precision: storage of the tables, one of PRECISIONS
+
+    @return Dict: {"kind": "second", "vocab": Vocabulary,
+                   "emissions": (V, K) array,
+                   "transitions": (K+1, K+1, K) array of y_jm2, y_jm1, y_j,
+                   "stop": (K+1, K+1) array of y_jm2, y_jm1,
+                   and the candidate index from buildCandidates}
+    """
+    with instrument.timer("buildTables2"):
+        vocab, logE = buildEmissionTable(emissions, dictionary)
+        tags = vocab.tags
+        tagIndex = vocab.tagIds
+        history = dict(tagIndex, _START=vocab.boundary)
+
+        logA = np.full((len(tags) + 1, len(tags) + 1, len(tags)), -np.inf)
+        logStop = np.full((len(tags) + 1, len(tags) + 1), -np.inf)
+        for (y_jm2, y_jm1), children in transitions.items():
+            if y_jm2 not in history or y_jm1 not in history:
                 continue
-            else:
-                last_space_index = temp.rfind(" ")
-                word = temp[:last_space_index].lower()
-                out.add(word)
 
-    return out
+            for y_j, p in children.items():
+                if p is None or p == 0:
+                    continue
+
+                if y_j == "_STOP":
+                    logStop[history[y_jm2], history[y_jm1]] = log(p)
+                elif y_j in tagIndex:
+                    logA[history[y_jm2], history[y_jm1], tagIndex[y_j]] = log(p)
+
+    return setPrecision({
+        "kind": "second",
+        "vocab": vocab,
+        "emissions": logE,
+        "transitions": logA,
+        "stop": logStop,
+        **buildCandidates(emitting(logE)),
+    }, precision)
+
+
+def setPrecision(tables, precision):
+    """
+    Returns tables with their log tables stored as precision. float32
+    halves the memory and keeps -inf. int16 quarters it by storing
+    log scores rounded to a fixed step, with QUANTIZED_MISSING for -inf;
+    the step of each table is kept in tables["meta"]["scales"] so the
+    tables can be saved with saveModel and loaded again
+
+    @param tables: output from buildTables, buildTables2 or loadModel function
+    @param precision: one of PRECISIONS
+
+    @return Dict: same keys as tables
+    """
+    if precision not in PRECISIONS:
+        raise ValueError("Unknown precision {}".format(precision))
+
+    tables = dict(tables)
+    tables.pop("dequantized", None)
+    meta = dict(tables.get("meta", {}))
+    scales = meta.pop("scales", {})
+    meta["precision"] = precision
+    if precision == "int16":
+        meta["scales"] = {}
+
+    for name in LOG_TABLES:
+        if name not in tables:
+            continue
+
+        # go back to floats first, so any precision can be converted to any other
+        table = tables[name]
+        if table.dtype == np.int16:
+            table = dequantize(table, scales[name])
+
+        if precision == "int16":
+            tables[name], meta["scales"][name] = quantize(table)
+        else:
+            tables[name] = table.astype(precision, copy=False)
+
+    tables["meta"] = meta
+    return tables
+
+
+def quantize(logs):
+    """
+    Rounds log scores to int16 with the finest step that fits the
+    lowest finite score
+
+    @return Tuple: (int16 array, scale), where log p is about q / scale
+    """
+    finite = np.isfinite(logs)
+    lowest = -logs[finite].min() if finite.any() else 0.0
+    scale = float(np.iinfo(np.int16).max) / max(lowest, 1.0)
+
+    quantized = np.full(logs.shape, QUANTIZED_MISSING, dtype=np.int16)
+    quantized[finite] = np.round(logs[finite] * scale)
+    return quantized, scale
+
+
+def dequantize(quantized, scale):
+    """
+    Turns int16 log scores from quantize back into float32 logs, with -inf
+    where quantized is QUANTIZED_MISSING
+    """
+    logs = quantized.astype(np.float32)
+    logs /= np.float32(scale)
+    logs[quantized == QUANTIZED_MISSING] = -np.inf
+    return logs
+
+
+def logTable(tables, name):
+    """
+    Returns the log table name as floats. An int16 table is dequantized
+    once and kept in tables["dequantized"], which saveModel ignores;
+    use logRows for the emission table, so only the rows a
+    sentence needs are dequantized
+    """
+    table = tables[name]
+    if table.dtype != np.int16:
+        return table
+
+    dequantized = tables.setdefault("dequantized", {})
+    if name not in dequantized:
+        dequantized[name] = dequantize(table, tables["meta"]["scales"][name])
+    return dequantized[name]
+
+
+def logRows(tables, name, ids):
+    """
+    Returns tables[name][ids] as floats, dequantizing only those rows
+    """
+    rows = tables[name][ids]
+    if rows.dtype != np.int16:
+        return rows
+    return dequantize(rows, tables["meta"]["scales"][name])
@@ -0,0 +1,217 @@
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
+from pathlib import Path
+from time import perf_counter
+import argparse
+import json
+import part2
+import part5
+from sharedFunctions import countCorpus, estEmissions, estTransitions, estTransitions2, getDictionary,\
+    buildTables, buildTables2
+from evalResult import compare_lines
+from tagger import tagLines
+import instrument
+
+DATASETS = ["EN", "FR", "CN", "SG"]
+
+# parts whose emissions are smoothed with k, and the parts sweep can tune
+SMOOTHED_PARTS = ["part2", "part3", "part4"]
+PARTS = SMOOTHED_PARTS + ["part5"]
+
+# values tried when none are given
+K_VALUES = [0.5, 1, 2, 3, 5]
+EPOCH_VALUES = [5, 10, 15, 20, 23, 25, 30]
+
+# counts and encoded train files of every dataset, sent once to each worker process
+workerCounts = None
+workerEncoded = None
+
+
+def initSweep(counts, encoded):
+    """
+    Keeps the counts and encoded train files in each worker process
+    """
+    global workerCounts, workerEncoded
+    workerCounts = counts
+    workerEncoded = encoded
+
+
+def scoreModel(model, ds):
+    """
+    Tags dev.in of dataset ds with model and scores it against
+    dev.out, without writing any file
+
+    @return Dict: {"entityF", "entityTypeF"}
+    """
+    out = StringIO()
+    with open(Path(ds) / "dev.in", encoding="utf-8") as lines:
+        tagLines(model, lines, out)
+
+    with open(Path(ds) / "dev.out", encoding="utf-8") as gold:
+        result = compare_lines(gold, StringIO(out.getvalue()))
+
+    return {"entityF": result["entity"]["f"], "entityTypeF": result["entityType"]["f"]}
+
+
+def runSmoothingTrial(part, ds, k):
+    """
+    Builds the model of part for dataset ds with smoothing constant k
+    from the worker's counts, and scores it on dev
+
+    @return: list with one result
+    """
+    start = perf_counter()
+    counts = workerCounts[ds]
+    emissions = estEmissions(None, k, counts)
+
+    if part == "part2":
+        model = part2.buildArgmaxTable(emissions)
+    elif part == "part3":
+        model = buildTables(emissions, estTransitions(None, counts), getDictionary(None, counts))
+    else:
+        model = buildTables2(emissions, estTransitions2(None, counts), getDictionary(None, counts))
+
+    result = {"part": part, "dataset": ds, "params": {"k": k}}
+    result.update(scoreModel(model, ds))
+    result["seconds"] = perf_counter() - start
+    return [result]
+
+
+def runPerceptronTrial(ds, schedule, epochs):
+    """
+    Trains part 5 on dataset ds once for the most epochs asked for,
+    scoring the weights on dev after each epoch in epochs
+
+    @return: list of results, one per epoch count
+    """
+    results = []
+    start = perf_counter()
+
+    def checkpoint(epoch, weights):
+        if epoch in epochs:
+            result = {"part": "part5", "dataset": ds, "params": {"epochs": epoch, "schedule": schedule}}
+            result.update(scoreModel(part5.buildModel(*weights()), ds))
+            result["seconds"] = perf_counter() - start
+            results.append(result)
+
+    part5.train(None, max(epochs), schedule=schedule, encoded=workerEncoded[ds], onEpoch=checkpoint)
+    return results
+
+
+def sweep(parts, datasets=DATASETS, kValues=K_VALUES, epochValues=EPOCH_VALUES,
+          schedules=tuple(part5.SCHEDULES), workers=None):
+    """
+    Scores every setting of every part on the dev set of each dataset.
+    Each train file is read once, then the trials run on a pool of
+    processes that all start from the same counts
+
+    @param parts: list of parts, from PARTS
+    @param kValues: smoothing constants tried for part2, part3 and part4
+    @param epochValues: epoch counts tried for part5
+    @param schedules: learning rate schedules tried for part5
+    @param workers: number of processes, defaults to the number of CPUs
+
+    @return: list of results, in the order of ranked
+    """
+    with instrument.timer("sweep.count"):
+        counts = {}
+        encoded = {}
+        for ds in datasets:
+            if any(part in SMOOTHED_PARTS for part in parts):
+                counts[ds] = countCorpus(Path(ds) / "train")
+            if "part5" in parts:
+                encoded[ds] = part5.encodeCorpus(Path(ds) / "train")
+
+    with instrument.timer("sweep"),\
+         ProcessPoolExecutor(workers, initializer=initSweep, initargs=(counts, encoded)) as pool:
+        futures = []
+        for ds in datasets:
+            for part in parts:
+                if part == "part5":
+                    for schedule in schedules:
+                        futures.append(pool.submit(runPerceptronTrial, ds, schedule, set(epochValues)))
+                else:
+                    for k in kValues:
+                        futures.append(pool.submit(runSmoothingTrial, part, ds, k))
+
+        return ranked([result for future in futures for result in future.result()])
+
+
+def ranked(results):
+    """
+    Orders results by part and dataset, best first within each by
+    entity type F then entity F, and numbers them from 1
+    """
+    results = sorted(results, key=lambda r: (PARTS.index(r["part"]), r["dataset"],
+                                             -r["entityTypeF"], -r["entityF"]))
+    rank = 0
+    for i, result in enumerate(results):
+        same = i > 0 and (result["part"], result["dataset"]) == (results[i - 1]["part"],
+                                                                   results[i - 1]["dataset"])
+        rank = rank + 1 if same else 1
+        result["rank"] = rank
+
+    return results
+
+
+def formatParams(params):
+    return " ".join("{}={}".format(name, value) for name, value in params.items())
+
+
+def writeTable(results, output):
+    """
+    Writes results as a ranked text table to output and as JSON to output.json
+    """
+    with open(output, "w", encoding="utf-8") as f:
+        f.write("{:<6} {:<3} {:>4}  {:<28} {:>8} {:>8}\n".format(
+            "part", "", "rank", "params", "entity F", "type F"))
+        for result in results:
+            f.write("{:<6} {:<3} {:>4}  {:<28} {:>8.4f} {:>8.4f}\n".format(
+                result["part"], result["dataset"], result["rank"], formatParams(result["params"]),
+                result["entityF"], result["entityTypeF"]))
+
+    with open("{}.json".format(output), "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+
+def splitValues(text, cast):
+    return [cast(value) for value in text.split(",") if value]
+
+
+# main
+# python sweep.py tries every k, epoch count and schedule on every dataset,
+# see python sweep.py --help for choosing them
+if __name__ == "__main__":
+    instrument.fromEnvironment()
+    parser = argparse.ArgumentParser(description="Scores hyperparameter settings on each dev set")
+    parser.add_argument("datasets", nargs="*", default=DATASETS, help="dataset folders, default all")
+    parser.add_argument("--parts", default=",".join(PARTS), help="comma separated parts: " + ", ".join(PARTS))
+    parser.add_argument("--k", default=",".join(map(str, K_VALUES)),
+                        help="comma separated smoothing constants for estEmissions")
+    parser.add_argument("--epochs", default=",".join(map(str, EPOCH_VALUES)),
+                        help="comma separated epoch counts for part5")
+    parser.add_argument("--schedules", default=",".join(part5.SCHEDULES),
+                        help="comma separated learning rate schedules: " + ", ".join(part5.SCHEDULES))
+    parser.add_argument("--workers", type=int, help="number of processes, default the number of CPUs")
+    parser.add_argument("--output", default="sweep_results", help="text table to write, with JSON next to it")
+    args = parser.parse_args()
+
+    parts = splitValues(args.parts, str)
+    schedules = splitValues(args.schedules, str)
+    for part in parts:
+        if part not in PARTS:
+            parser.error("unknown part {}".format(part))
+    for schedule in schedules:
+        if schedule not in part5.SCHEDULES:
+            parser.error("unknown schedule {}".format(schedule))
+
+    results = sweep(parts, args.datasets, splitValues(args.k, float), splitValues(args.epochs, int),
+                    schedules, args.workers)
+    writeTable(results, args.output)
+
+    for result in results:
+        if result["rank"] == 1:
+            print("{:<6} {:<3} {:<28} type F {:.4f}".format(
+                result["part"], result["dataset"], formatParams(result["params"]), result["entityTypeF"]))
+    print("Output:", args.output)
+    print("Done!")
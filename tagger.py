@@ -0,0 +1,264 @@
+from collections import deque
+from importlib import import_module
+from io import BytesIO, StringIO, TextIOWrapper
+from mmap import mmap, ACCESS_READ
+import os
+import sys
+from modelFile import loadModel
+from corpus import Corpus
+from decodeCache import DecodeCache
+import instrument
+
+# sentences in each chunk handed to a worker
+CHUNK_SIZE = 500
+
+# batch sizes used for the Viterbi models when none is given
+BATCH_SIZES = {"first": 128, "second": 32}
+
+# module that decodes each kind of model, imported the first time it is used
+PART_MODULES = {"argmax": "part2", "first": "part3", "second": "part4", "perceptron": "part5"}
+
+# models that write words lowercased, as part2 and part5 do
+LOWERCASE_KINDS = ("argmax", "perceptron")
+
+# model, decode cache and memory-mapped input file opened once by each worker process
+workerModel = None
+workerBatchSize = None
+workerCache = None
+workerData = None
+
+
+def tagLines(model, lines, out, batchSize=None):
+    """
+    Tags lines of unlabelled text with any saved model, writing exactly
+    what part2, part3, part4 or part5 would write for them
+
+    @param model: output from loadModel function
+    @param lines: iterable of lines of unlabelled text
+    @param out: file-like object to write labelled text to
+    @param batchSize: sentences decoded together by the Viterbi models
+    """
+    kind = model["kind"]
+    part = partModule(kind)
+    if kind == "argmax":
+        part.predictTableStream(model, lines, out)
+    elif kind == "perceptron":
+        part.predictModelStream(model, lines, out)
+    else:
+        part.predictViterbiStream(None, None, None, lines, out, model, batchSize or BATCH_SIZES[kind])
+
+
+def tagSentences(model, sentences, batchSize=None):
+    """
+    Tags lists of words with any saved model
+
+    @param model: output from loadModel function
+    @param sentences: list of lists of words
+    @param batchSize: sentences decoded together by the Viterbi models
+
+    @return: list of predicted tag sequences, one per sentence
+    """
+    kind = model["kind"]
+    part = partModule(kind)
+    if kind == "argmax":
+        return [part.predictTableList(model, sentence) for sentence in sentences]
+    elif kind == "perceptron":
+        return [part.predictSentenceArray(model, sentence) for sentence in sentences]
+    else:
+        return part.predictViterbiBatch(model, sentences, batchSize or BATCH_SIZES[kind])
+
+
+def partModule(kind):
+    """
+    Returns the module of part2 to part5 that decodes models of kind,
+    importing only that one
+    """
+    if kind not in PART_MODULES:
+        raise ValueError("Unknown model kind {}".format(kind))
+    return import_module(PART_MODULES[kind])
+
+
+def tagSentencesCached(model, sentences, cache, batchSize=None):
+    """
+    Same as tagSentences, but takes the tags of sentences seen before
+    from cache and decodes only the others, each distinct one once
+
+    @param cache: DecodeCache, emptied if it holds results of another model
+    """
+    cache.bind(model)
+    keys = [cache.key(sentence) for sentence in sentences]
+    sequences = [cache.get(key) for key in keys]
+
+    # first sentence with each key not in cache
+    missing = {}
+    for i, key in enumerate(keys):
+        if sequences[i] is None:
+            missing.setdefault(key, i)
+
+    decoded = dict(zip(missing, tagSentences(model, [sentences[i] for i in missing.values()],
+                                             batchSize)))
+    for key, sequence in decoded.items():
+        cache.put(key, sequence)
+
+    return [decoded[key] if sequence is None else sequence for key, sequence in zip(keys, sequences)]
+
+
+def tagLinesCached(model, lines, out, cache, batchSize=None):
+    """
+    Same as tagLines, but looks each sentence up in cache first.
+    Empty sentences and sentences with blank looking lines are
+    passed to tagLines, which knows how each part treats them
+
+    @param cache: DecodeCache, emptied if it holds results of another model
+    """
+    sentences = list(readSentences(lines))
+    words = [[line.strip() for line in sentence[:-1]] for sentence in sentences]
+    plain = [sentence for sentence in words if sentence and all(sentence)]
+    sequences = iter(tagSentencesCached(model, plain, cache, batchSize))
+    lowercase = model["kind"] in LOWERCASE_KINDS
+
+    for lineList, sentence in zip(sentences, words):
+        if sentence and all(sentence):
+            if lowercase:
+                sentence = [word.lower() for word in sentence]
+            for word, tag in zip(sentence, next(sequences)):
+                out.write("{} {}\n".format(word, tag))
+            out.write("\n")
+        else:
+            tagLines(model, lineList, out, batchSize)
+
+
+def readSentences(lines):
+    """
+    Groups lines into sentences as they arrive, so only one sentence
+    is held in memory at a time. A last sentence with no blank line
+    after it is given one, so it is tagged instead of dropped
+
+    @return: generator of lists of lines, each ending with a blank line
+    """
+    sentence = []
+    for line in lines:
+        sentence.append(line)
+        if line == "\n":
+            yield sentence
+            sentence = []
+
+    if sentence:
+        if not sentence[-1].endswith("\n"):
+            sentence[-1] += "\n"
+        sentence.append("\n")
+        yield sentence
+
+
+def tagStream(model, lines, out, cache=None):
+    """
+    Tags lines of unlabelled text one sentence at a time, flushing out
+    after each sentence. Memory does not grow with the input, so lines
+    can be an endless stream such as sys.stdin
+
+    @param model: output from loadModel function
+    @param lines: iterable of lines of unlabelled text
+    @param out: file-like object to write labelled text to
+    @param cache: DecodeCache for repeated sentences, or None
+    """
+    for sentence in readSentences(lines):
+        if cache is None:
+            tagLines(model, sentence, out, 1)
+        else:
+            tagLinesCached(model, sentence, out, cache, 1)
+        out.flush()
+
+
+def initWorker(modelPath, batchSize, inputFile, cacheSize=0):
+    """
+    Loads the model and maps the input file once in each worker process
+    """
+    global workerModel, workerBatchSize, workerCache, workerData
+    workerModel = loadModel(modelPath)
+    workerBatchSize = batchSize
+    workerCache = DecodeCache(cacheSize) if cacheSize else None
+    with open(inputFile, "rb") as f:
+        workerData = mmap(f.fileno(), 0, access=ACCESS_READ)
+
+
+def tagChunk(begin, end):
+    """
+    Tags the bytes between begin and end of the input file in a worker
+    process, so only offsets are sent to it
+
+    @return: labelled text for the chunk
+    """
+    # read like open() does, so line breaks are the same as in a sequential run
+    lines = TextIOWrapper(BytesIO(workerData[begin:end]), encoding="utf-8")
+    out = StringIO()
+    if workerCache is None:
+        tagLines(workerModel, lines, out, workerBatchSize)
+    else:
+        tagLinesCached(workerModel, lines, out, workerCache, workerBatchSize)
+    return out.getvalue()
+
+
+def tagFileParallel(modelPath, inputFile, outputFile, workers=None, chunkSize=CHUNK_SIZE,
+                    batchSize=None, cacheSize=0):
+    """
+    Tags inputFile on a pool of processes. The file is cut into chunks
+    of about chunkSize sentences with its Corpus index and the labelled
+    chunks are written in input order, so outputFile is the same as a
+    sequential run would give
+
+    @param modelPath: name of file saved by saveModel
+    @param inputFile: name of file with unlabelled text
+    @param outputFile: name of file to save labelled text to
+    @param workers: number of processes, defaults to the number of CPUs
+    @param chunkSize: number of sentences sent to a worker at a time
+    @param batchSize: sentences decoded together by the Viterbi models
+    @param cacheSize: sentences each worker keeps in its DecodeCache, 0 for none
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    workers = workers or os.cpu_count()
+    with Corpus(inputFile, strict=True) as corpus:
+        ranges = [corpus.byteRange(first, last)
+                  for first, last in corpus.chunks(-(-len(corpus) // chunkSize))]
+
+    with open(outputFile, "w", encoding="utf-8") as out,\
+         ProcessPoolExecutor(workers, initializer=initWorker,
+                             initargs=(str(modelPath), batchSize, str(inputFile), cacheSize)) as pool:
+
+        # keep a few chunks per worker in flight and write them in order
+        pending = deque()
+        for begin, end in ranges:
+            pending.append(pool.submit(tagChunk, begin, end))
+            if len(pending) >= 2 * workers:
+                out.write(pending.popleft().result())
+
+        while pending:
+            out.write(pending.popleft().result())
+
+
+# main
+if __name__ == "__main__":
+    instrument.fromEnvironment()
+    if len(sys.argv) == 2 or (len(sys.argv) == 3 and sys.argv[2].isdigit()):
+        cacheSize = int(sys.argv[2]) if len(sys.argv) == 3 else 0
+        cache = DecodeCache(cacheSize) if cacheSize else None
+        tagStream(loadModel(sys.argv[1]), sys.stdin, sys.stdout, cache)
+        if cache is not None:
+            print("Cache:", cache.stats(), file=sys.stderr)
+        sys.exit()
+
+    if len(sys.argv) < 4:
+        print("Usage: python tagger.py [model file] [input file] [output file] [workers] [chunk size] "
+              "[cache size]")
+        print("       python tagger.py [model file] [cache size] < [input] > [output]")
+        sys.exit()
+
+    modelPath, inputFile, outputFile = sys.argv[1:4]
+    workers = int(sys.argv[4]) if len(sys.argv) > 4 else None
+    chunkSize = int(sys.argv[5]) if len(sys.argv) > 5 else CHUNK_SIZE
+    cacheSize = int(sys.argv[6]) if len(sys.argv) > 6 else 0
+
+    tagFileParallel(modelPath, inputFile, outputFile, workers, chunkSize, cacheSize=cacheSize)
+
+    print("Output:", outputFile)
+    print("Done!")
@@ -0,0 +1,94 @@
+UNK = "#UNK#"
+START = "_START"
+STOP = "_STOP"
+
+# id of #UNK#, which every vocabulary has
+UNK_ID = 0
+
+
+class Vocabulary:
+    """
+    Maps words and tags to dense integer ids, shared by every array based
+    model and saved with it. Word id UNK_ID is always #UNK#, and tag id
+    len(tags) stands for _START in transition rows and _STOP in columns
+    """
+
+    def __init__(self, words=(), tags=()):
+        self.words = [UNK]
+        self.wordIds = {UNK: UNK_ID}
+        self.tags = []
+        self.tagIds = {}
+
+        for word in words:
+            self.addWord(word)
+        for tag in tags:
+            self.addTag(tag)
+
+    def copy(self):
+        """
+        Returns a vocabulary with the same ids that can grow on its own
+        """
+        vocab = Vocabulary()
+        vocab.words = list(self.words)
+        vocab.wordIds = dict(self.wordIds)
+        vocab.tags = list(self.tags)
+        vocab.tagIds = dict(self.tagIds)
+        return vocab
+
+    def addWord(self, word):
+        """
+        Returns the id of word, giving it the next id if it is new
+        """
+        if word not in self.wordIds:
+            self.wordIds[word] = len(self.words)
+            self.words.append(word)
+        return self.wordIds[word]
+
+    def addTag(self, tag):
+        """
+        Returns the id of tag, giving it the next id if it is new
+        """
+        if tag not in self.tagIds:
+            self.tagIds[tag] = len(self.tags)
+            self.tags.append(tag)
+        return self.tagIds[tag]
+
+    @property
+    def boundary(self):
+        """
+        Tag id standing for _START and _STOP
+        """
+        return len(self.tags)
+
+    def wordId(self, word):
+        """
+        Returns the id of word, or UNK_ID if it was not in training
+        """
+        return self.wordIds.get(word, UNK_ID)
+
+    def encode(self, textList):
+        """
+        Returns the ids of a list of words, lowercased like the models expect
+        """
+        wordIds = self.wordIds
+        return [wordIds.get(word.lower(), UNK_ID) for word in textList]
+
+    def tagId(self, tag):
+        """
+        Returns the id of tag, the boundary id for _START and _STOP
+        """
+        if tag == START or tag == STOP:
+            return self.boundary
+        return self.tagIds[tag]
+
+    def decode(self, tagIds):
+        """
+        Returns the tags for a list of tag ids
+        """
+        return [self.tags[i] for i in tagIds]
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        return word in self.wordIds